@@ -1,7 +1,7 @@
 # candidate_details_ui.py
 import pandas as pd
 import streamlit as st
-from common_functions import load_table, save_table, clean_columns, download_button_for_df
+from common_functions import load_table, save_table, save_table_changes, clean_columns, download_button_for_df
 
 def candidate_details_ui(year, program):
     st.header("👨‍🎓 Candidate Details")
@@ -43,6 +43,7 @@ def candidate_details_ui(year, program):
     # ---------------- All Candidates ----------------
     with tab_all:
         st.subheader("All Candidates")
+        shown_stu = df_stu
         edited_stu = st.data_editor(
             df_stu,
             num_rows="dynamic",
@@ -57,6 +58,7 @@ def candidate_details_ui(year, program):
             colleges = sorted(df_stu["College"].dropna().unique())
             selected_college = st.selectbox("Select College", ["All"] + list(colleges))
             df_filtered = df_stu if selected_college == "All" else df_stu[df_stu["College"] == selected_college]
+            shown_stu = df_filtered
             edited_stu = st.data_editor(
                 df_filtered,
                 num_rows="dynamic",
@@ -73,6 +75,7 @@ def candidate_details_ui(year, program):
             programs = sorted(df_stu["Program"].dropna().unique())
             selected_program = st.selectbox("Select Program", ["All"] + list(programs))
             df_filtered = df_stu if selected_program == "All" else df_stu[df_stu["Program"] == selected_program]
+            shown_stu = df_filtered
             edited_stu = st.data_editor(
                 df_filtered,
                 num_rows="dynamic",
@@ -89,6 +92,7 @@ def candidate_details_ui(year, program):
             categories = sorted(df_stu["Category"].dropna().unique())
             selected_category = st.selectbox("Select Category", ["All"] + list(categories))
             df_filtered = df_stu if selected_category == "All" else df_stu[df_stu["Category"] == selected_category]
+            shown_stu = df_filtered
             edited_stu = st.data_editor(
                 df_filtered,
                 num_rows="dynamic",
@@ -105,8 +109,9 @@ def candidate_details_ui(year, program):
         if "Program" not in edited_stu.columns:
             edited_stu["Program"] = program
 
-        save_table(
+        save_table_changes(
             "Candidate Details",
+            shown_stu,
             edited_stu,
             replace_where={"AdmissionYear": year, "Program": program}
         )
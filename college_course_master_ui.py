@@ -1,6 +1,6 @@
 import pandas as pd
 import streamlit as st
-from common_functions import load_table, save_table, clean_columns, download_button_for_df, filter_and_sort_dataframe
+from common_functions import load_table, save_table, save_table_changes, clean_columns, download_button_for_df, filter_and_sort_dataframe
 
 def college_course_master_ui(year: str, program: str):
     """UI for College Course Master management"""
@@ -74,8 +74,9 @@ def college_course_master_ui(year: str, program: str):
         if dedup_cols:
             edited_cc = edited_cc.drop_duplicates(subset=dedup_cols)
 
-        save_table(
+        save_table_changes(
             "College Course Master",
+            df_cc_filtered,
             edited_cc,
             replace_where={"AdmissionYear": year, "Program": program}
         )
@@ -1,6 +1,6 @@
 import pandas as pd
 import streamlit as st
-from common_functions import load_table, save_table, clean_columns, download_button_for_df, filter_and_sort_dataframe
+from common_functions import load_table, save_table, save_table_changes, clean_columns, download_button_for_df, filter_and_sort_dataframe
 
 def college_master_ui(year: str, program: str):
     """UI for College Master management (append uploads; view/edit all rows including duplicates)."""
@@ -51,6 +51,8 @@ def college_master_ui(year: str, program: str):
                 st.session_state[ss_key],
                 replace_where={"AdmissionYear": year, "Program": program}
             )
+            # Reload so appended rows carry their stored ids for later change-set saves
+            st.session_state[ss_key] = load_table("College Master", year, program)
 
             st.success(f"✅ Appended {len(df_new)} rows — total now {len(st.session_state[ss_key])} rows for {year} / {program}.")
         except Exception as e:
@@ -87,15 +89,16 @@ def college_master_ui(year: str, program: str):
             if "Program" not in edited.columns:
                 edited["Program"] = program
 
-            # Persist exactly what user edited (this removes any duplicates only if user removed them)
-            save_table(
+            # Persist only the rows the user inserted, changed or removed
+            save_table_changes(
                 "College Master",
+                df_col_filtered,
                 edited,
                 replace_where={"AdmissionYear": year, "Program": program}
             )
 
             # Update session-state so UI reflects saved data
-            st.session_state[ss_key] = edited
+            st.session_state[ss_key] = load_table("College Master", year, program)
 
             st.success("✅ College Master saved (storage updated).")
         except Exception as e:
@@ -3,18 +3,74 @@ import pandas as pd
 import streamlit as st
 import io
 import re
-import random
-import string
+import hashlib
+import importlib.util
+import shlex
+from functools import reduce
+import time
+from datetime import timedelta
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from supabase import create_client
 
+# Rows sent per upsert request by save_table
+SAVE_BATCH_SIZE = 500
+# Rows requested per range page by load_table (PostgREST's default max-rows)
+LOAD_PAGE_SIZE = 1000
+# Page requests load_table runs concurrently
+LOAD_MAX_WORKERS = 4
+# Seconds a cached load_table result stays fresh
+TABLE_CACHE_TTL = 300
+# Memory bound of the table cache; least recently used tables are evicted first
+TABLE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Derived per-DataFrame indexes (search text, distinct values, ...) kept for each kind
+INDEX_CACHE_MAX_ENTRIES = 16
+# Memory bound of the built CSV/Excel downloads shared by all sessions
+EXPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Columns with at most this many distinct values get a multiselect filter
+FILTER_MAX_OPTIONS = 50
+# Frames with more rows than this are exported with xlsxwriter's constant-memory mode
+EXPORT_CONSTANT_MEMORY_ROWS = 50_000
+
 # -------------------------
 # 🔐 Supabase Connection
 # -------------------------
+# One client per process: its HTTP session keeps connections alive across reruns
+_client = None
+_client_lock = threading.Lock()
+
+
+def _client_is_healthy(client) -> bool:
+    session = getattr(getattr(client, "postgrest", None), "session", None)
+    return session is None or not getattr(session, "is_closed", False)
+
+
+def reset_supabase(failed=None):
+    """
+    Drops the pooled client so the next get_supabase() call reconnects. With failed,
+    only if that client is still the pooled one, so a thread reporting a stale
+    client never drops the replacement another thread already created. The old
+    client is not closed: requests still in flight on it are left to finish.
+    """
+    global _client
+    with _client_lock:
+        if failed is None or _client is failed:
+            _client = None
+
+
 def get_supabase():
     """
-    Returns a Supabase client.
+    Returns the process-wide Supabase client, creating it on first use
+    and recreating it if its HTTP session has been closed.
     Handles missing secrets gracefully and displays a friendly error.
     """
+    global _client
+    client = _client
+    if client is not None and _client_is_healthy(client):
+        return client
+
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
@@ -25,12 +81,45 @@ def get_supabase():
         )
         return None
 
+    with _client_lock:
+        if _client is not None and _client_is_healthy(_client):
+            return _client
+        try:
+            _client = create_client(url, key)
+            return _client
+        except Exception as e:
+            _client = None
+            st.error(f"❌ Failed to connect to Supabase: {e}")
+            return None
+
+
+def _is_closed_client_error(e: Exception) -> bool:
+    return isinstance(e, RuntimeError) and "client has been closed" in str(e)
+
+
+def _execute(build, idempotent: bool = True):
+    """
+    Runs build(client).execute() on the pooled client and retries once.
+    A dropped connection is retried on the same client (httpx discards the dead
+    pooled connection); a client closed underneath the request is replaced first.
+    Requests that may insert rows (idempotent=False) are retried after a transport
+    error only when it failed before anything was sent, so a committed insert is
+    never sent twice.
+    """
+    client = get_supabase()
     try:
-        client = create_client(url, key)
-        return client
-    except Exception as e:
-        st.error(f"❌ Failed to connect to Supabase: {e}")
-        return None
+        return build(client).execute()
+    except httpx.TransportError as e:
+        if not idempotent and not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+            raise
+    except RuntimeError as e:
+        if not _is_closed_client_error(e):
+            raise
+        reset_supabase(client)
+        client = get_supabase()
+        if client is None:
+            raise
+    return build(client).execute()
 
 
 def get_conn():
@@ -63,26 +152,201 @@ def clean_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# -------------------------
+# 🗃️ Table Cache
+# -------------------------
+# Shared by all sessions: (table, year, program, columns, filters, order_by) -> (loaded_at, nbytes, df),
+# most recently used last
+_table_cache = OrderedDict()
+_table_cache_lock = threading.Lock()
+_table_cache_bytes = 0
+# Bumped on every invalidation so a load that raced a save is not cached
+_table_generation = {}
+_table_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def _cache_get(key):
+    with _table_cache_lock:
+        entry = _table_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= TABLE_CACHE_TTL:
+            _table_cache.move_to_end(key)
+            _table_cache_stats["hits"] += 1
+            return entry[2].copy()
+        if entry is not None:
+            _cache_drop(key)
+        _table_cache_stats["misses"] += 1
+        return None
+
+
+def _cache_drop(key):
+    global _table_cache_bytes
+    entry = _table_cache.pop(key, None)
+    if entry is not None:
+        _table_cache_bytes -= entry[1]
+
+
+def _cache_put(key, df: pd.DataFrame, generation: int):
+    global _table_cache_bytes
+    nbytes = int(df.memory_usage(deep=True).sum())
+    if nbytes > TABLE_CACHE_MAX_BYTES:
+        return
+    with _table_cache_lock:
+        if _table_generation.get(key[0], 0) != generation:
+            return
+        _cache_drop(key)
+        _table_cache[key] = (time.monotonic(), nbytes, df)
+        _table_cache_bytes += nbytes
+        while _table_cache_bytes > TABLE_CACHE_MAX_BYTES:
+            _cache_drop(next(iter(_table_cache)))
+            _table_cache_stats["evictions"] += 1
+
+
+def invalidate_table_cache(table: str = None):
+    """Drops cached loads of table (or of every table) so the next load_table refetches."""
+    with _table_cache_lock:
+        for key in [k for k in _table_cache if table is None or k[0] == table]:
+            _cache_drop(key)
+        for t in ([table] if table is not None else list(_table_generation)):
+            _table_generation[t] = _table_generation.get(t, 0) + 1
+        _table_cache_stats["invalidations"] += 1
+
+
+def table_cache_stats() -> dict:
+    """Hit/miss counters plus current size of the table cache."""
+    with _table_cache_lock:
+        stats = dict(_table_cache_stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(_table_cache)
+        stats["bytes"] = _table_cache_bytes
+        return stats
+
+
 # -------------------------
 # 📥 Load Table
 # -------------------------
-def load_table(table: str, year: str = None, program: str = None) -> pd.DataFrame:
+# Predicate operators load_table pushes down to PostgREST
+FILTER_OPS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "between", "like", "ilike")
+
+
+def _normalize_filters(filters) -> tuple:
+    """
+    Accepts {column: value} (a list/tuple/set value means "in") or an iterable of
+    (column, op, value) triples and returns a hashable tuple of triples.
+    """
+    if not filters:
+        return ()
+    if isinstance(filters, dict):
+        triples = [(col, "in", val) if isinstance(val, (list, tuple, set)) else (col, "eq", val)
+                   for col, val in filters.items()]
+    else:
+        triples = [tuple(f) for f in filters]
+
+    normalized = []
+    for col, op, val in triples:
+        op = str(op).lower()
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator '{op}' for {col}")
+        if op in ("in", "between"):
+            val = tuple(sorted(val, key=str)) if op == "in" else tuple(val)
+        normalized.append((col, op, val))
+    return tuple(normalized)
+
+
+def _select_query(sb, table: str, year: str = None, program: str = None, count: str = None,
+                  columns: tuple = None, filters: tuple = (), order_by: str = "id"):
+    select = ",".join(columns) if columns else "*"
+    query = sb.table(table).select(select, count=count) if count else sb.table(table).select(select)
+    if year:
+        query = query.eq("AdmissionYear", year)
+    if program:
+        query = query.eq("Program", program)
+    for col, op, val in filters:
+        if op == "in":
+            query = query.in_(col, list(val))
+        elif op == "between":
+            query = query.gte(col, val[0]).lte(col, val[1])
+        else:
+            query = getattr(query, op)(col, val)
+    return query.order(order_by) if order_by else query
+
+
+def load_table(table: str, year: str = None, program: str = None,
+               columns: list = None, filters=None,
+               page_size: int = LOAD_PAGE_SIZE, max_workers: int = LOAD_MAX_WORKERS,
+               use_cache: bool = True, order_by: str = "id") -> pd.DataFrame:
+    """
+    Loads a table in range pages so results are not truncated at the server row cap.
+    The first page also returns the exact row count; the remaining pages are fetched
+    concurrently and concatenated in order. Pages fetched and latency are kept in
+    st.session_state["load_stats"][table].
+    Results are served from the shared table cache for TABLE_CACHE_TTL seconds
+    or until save_table writes to the table.
+
+    columns limits the fetched columns; filters are applied server-side, either as
+    {column: value} equality/membership or as (column, op, value) triples with op
+    one of FILTER_OPS, e.g. ("Seats", "between", (1, 10)) or ("Name", "ilike", "%an%").
+
+    Pages are sliced from rows ordered by order_by, a unique column (default "id").
+    For tables without one pass order_by=None: the rows are then fetched in a
+    single request, which the server row cap may truncate (a warning says so).
+    """
+    columns = tuple(columns) if columns else None
+    filters = _normalize_filters(filters)
+    key = (table, year, program, columns, filters, order_by)
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+
     sb = get_supabase()
     if sb is None:
         return pd.DataFrame()
 
     try:
-        query = sb.table(table).select("*")
-        if year:
-            query = query.eq("AdmissionYear", year)
-        if program:
-            query = query.eq("Program", program)
-        data = query.execute()
-        records = data.data
-        if not records:
-            return pd.DataFrame()
-        df = pd.DataFrame(records)
-        return clean_columns(df)
+        generation = _table_generation.get(table, 0)
+        start = time.perf_counter()
+        page_size = max(1, int(page_size))
+        if not order_by:
+            # Without a stable order, range pages could skip or repeat rows
+            first = _execute(lambda c: _select_query(c, table, year, program, "exact", columns, filters, None))
+            records = list(first.data or [])
+            if first.count is not None and first.count > len(records):
+                st.warning(f"⚠️ {table}: loaded {len(records)} of {first.count} rows; "
+                           f"pass order_by to page through the rest.")
+            total = len(records)
+        else:
+            first = _execute(lambda c: _select_query(
+                c, table, year, program, "exact", columns, filters, order_by).range(0, page_size - 1))
+            records = list(first.data or [])
+            total = first.count if first.count is not None else len(records)
+
+        # The server may cap pages below page_size; page by what it actually returns
+        if 0 < len(records) < page_size and total > len(records):
+            page_size = len(records)
+
+        def fetch_page(offset):
+            return _execute(
+                lambda c: _select_query(c, table, year, program, None, columns, filters, order_by).range(
+                    offset, offset + page_size - 1)
+            ).data or []
+
+        offsets = list(range(len(records), total, page_size)) if records else []
+        if offsets:
+            with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(offsets)))) as pool:
+                for page in pool.map(fetch_page, offsets):
+                    records.extend(page)
+
+        st.session_state.setdefault("load_stats", {})[table] = {
+            "pages": 1 + len(offsets),
+            "rows": len(records),
+            "seconds": time.perf_counter() - start,
+        }
+        df = clean_columns(pd.DataFrame(records)) if records else pd.DataFrame()
+        if use_cache:
+            _cache_put(key, df, generation)
+            return df.copy()
+        return df
     except Exception as e:
         st.error(f"❌ Error loading {table}: {e}")
         return pd.DataFrame()
@@ -91,7 +355,64 @@ def load_table(table: str, year: str = None, program: str = None) -> pd.DataFram
 # -------------------------
 # 💾 Save Table
 # -------------------------
-def save_table(table: str, df: pd.DataFrame, replace_where: dict = None, append: bool = False):
+def _write_batches(table: str, batches: list) -> dict:
+    """
+    Sends each batch in a single request: {"batch", "records"} is upserted and
+    {"batch", "key", "delete_ids"} deletes those keys.
+    Returns rows written, elapsed time and the batches that failed.
+    """
+    written, failed = 0, []
+    start = time.perf_counter()
+    for batch in batches:
+        try:
+            if "delete_ids" in batch:
+                _execute(lambda c: c.table(table).delete().in_(batch["key"], batch["delete_ids"]))
+                written += len(batch["delete_ids"])
+            else:
+                # Upserts keyed on id can be resent; rows without an id would be inserted twice
+                keyed = all(r.get("id") is not None for r in batch["records"])
+                _execute(lambda c: c.table(table).upsert(batch["records"]), idempotent=keyed)
+                written += len(batch["records"])
+        except Exception as e:
+            failed.append({**batch, "error": str(e)})
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": written,
+        "batches": len(batches),
+        "failed": failed,
+        "seconds": elapsed,
+        "rows_per_sec": written / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _report_save(table: str, report: dict, summary: str = None):
+    """Shows the throughput of a save; failed batches are remembered and offered behind a Retry button."""
+    failed_store = st.session_state.setdefault("failed_batches", {})
+    if report["failed"]:
+        failed_store[table] = report["failed"]
+        for f in report["failed"]:
+            size = len(f.get("delete_ids") or f.get("records") or [])
+            st.error(f"❌ Batch {f['batch']} ({size} rows) failed for {table}: {f['error']}")
+        st.warning(f"⚠️ {len(report['failed'])} of {report['batches']} batches failed — use Retry to resend only those.")
+        # on_click runs on the next rerun even though the page's Save branch does not render this again
+        st.button(f"🔁 Retry failed batches ({table})", key=f"retry_failed_batches_{table}",
+                  on_click=retry_failed_batches, args=(table,))
+    else:
+        failed_store.pop(table, None)
+
+    if report["rows"]:
+        summary = summary or f"Saved {report['rows']} rows to {table}"
+        st.success(f"✅ {summary} in {report['batches']} batches ({report['rows_per_sec']:,.0f} rows/sec)")
+
+
+def _batches(records: list, batch_size: int, first_batch: int = 0) -> list:
+    batch_size = max(1, int(batch_size))
+    return [{"batch": first_batch + i // batch_size, "records": records[i:i + batch_size]}
+            for i in range(0, len(records), batch_size)]
+
+
+def save_table(table: str, df: pd.DataFrame, replace_where: dict = None, append: bool = False,
+               batch_size: int = SAVE_BATCH_SIZE) -> dict:
     sb = get_supabase()
     if sb is None:
         st.warning("⚠️ Cannot save data: Supabase connection not available.")
@@ -102,68 +423,352 @@ def save_table(table: str, df: pd.DataFrame, replace_where: dict = None, append:
         return
 
     df = clean_columns(df)
-    data = df.to_dict(orient="records")
+    data = _records(df)
 
     try:
         if replace_where and not append:
-            query = sb.table(table)
-            for k, v in replace_where.items():
-                query = query.eq(k, v)
-            existing = query.execute().data
-            if existing:
-                for row in existing:
-                    if "id" in row:
-                        sb.table(table).delete().eq("id", row["id"]).execute()
-
-        for record in data:
-            sb.table(table).upsert(record).execute()
-
-        st.success(f"✅ Saved {len(df)} rows to {table}")
+            def delete_slice(c):
+                query = c.table(table).delete()
+                for k, v in replace_where.items():
+                    query = query.eq(k, v)
+                return query
+            _execute(delete_slice)
     except Exception as e:
+        invalidate_table_cache(table)
         st.error(f"❌ Error saving {table}: {e}")
+        return
+
+    report = _write_batches(table, _batches(data, batch_size))
+    invalidate_table_cache(table)
+    _report_save(table, report)
+    return report
+
+
+def retry_failed_batches(table: str) -> dict:
+    """Resends only the batches of the last save on table that failed."""
+    failed = st.session_state.get("failed_batches", {}).get(table)
+    if not failed:
+        st.info(f"No failed batches to retry for {table}.")
+        return
+
+    sb = get_supabase()
+    if sb is None:
+        st.warning("⚠️ Cannot save data: Supabase connection not available.")
+        return
+
+    report = _write_batches(table, [{k: v for k, v in f.items() if k != "error"} for f in failed])
+    invalidate_table_cache(table)
+    _report_save(table, report)
+    return report
+
+
+def _records(df: pd.DataFrame) -> list:
+    """DataFrame rows as JSON-safe dicts (NaN/NaT become None)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _key_values(values: pd.Series) -> pd.Series:
+    """Primary keys as plain ints when numeric (data_editor turns int ids into floats)."""
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().all():
+        return numeric.astype("int64").astype(object)
+    return values.astype(object)
+
+
+def save_table_changes(table: str, original: pd.DataFrame, edited: pd.DataFrame, key: str = "id",
+                       replace_where: dict = None, batch_size: int = SAVE_BATCH_SIZE) -> dict:
+    """
+    Saves a data_editor result as a change set against original, the rows that were shown
+    in the editor: rows without a key are inserted, rows whose values changed are upserted
+    by key and keys missing from edited are deleted. Rows that were not shown are untouched.
+    Falls back to save_table(..., replace_where=...) when the rows carry no key column.
+    """
+    original = clean_columns(original) if original is not None else pd.DataFrame()
+    edited = clean_columns(edited) if edited is not None else pd.DataFrame()
+    if key not in original.columns or (not edited.empty and key not in edited.columns):
+        return save_table(table, edited, replace_where=replace_where, batch_size=batch_size)
+
+    sb = get_supabase()
+    if sb is None:
+        st.warning("⚠️ Cannot save data: Supabase connection not available.")
+        return
+
+    if edited.empty:
+        edited = pd.DataFrame(columns=original.columns)
+
+    is_new = edited[key].isna()
+    inserts = edited[is_new].drop(columns=[key])
+    kept = edited[~is_new].copy()
+    kept[key] = _key_values(kept[key])
+    kept = kept.drop_duplicates(subset=[key], keep="last").set_index(key)
+    before = original[original[key].notna()].copy()
+    before[key] = _key_values(before[key])
+    before = before.drop_duplicates(subset=[key], keep="last").set_index(key)
+
+    deleted_ids = [k for k in before.index if k not in kept.index]
+    common = kept.index.intersection(before.index)
+    old = before.loc[common].reindex(columns=kept.columns)
+    new = kept.loc[common]
+    changed_mask = ~((old == new) | (old.isna() & new.isna())).all(axis=1)
+    # Keys unknown to the snapshot (e.g. typed in by hand) are upserted as-is
+    updates = pd.concat([new[changed_mask], kept.loc[kept.index.difference(before.index)]])
+
+    batches = _batches(_records(updates.reset_index()), batch_size)
+    batches += _batches(_records(inserts), batch_size, first_batch=len(batches))
+    batch_size = max(1, int(batch_size))
+    for i in range(0, len(deleted_ids), batch_size):
+        batches.append({"batch": len(batches), "key": key, "delete_ids": deleted_ids[i:i + batch_size]})
+
+    if not batches:
+        st.info(f"No changes to save for {table}.")
+        return {"rows": 0, "batches": 0, "failed": [], "seconds": 0.0, "rows_per_sec": 0.0}
+
+    report = _write_batches(table, batches)
+    invalidate_table_cache(table)
+    _report_save(
+        table, report,
+        summary=f"{table}: {len(inserts)} inserted, {len(updates)} updated, {len(deleted_ids)} deleted"
+    )
+    return report
+
+
+# -------------------------
+# 🔢 DataFrame Indexes
+# -------------------------
+# kind -> OrderedDict(dataframe_version -> index), most recently used last
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def dataframe_version(df: pd.DataFrame) -> str:
+    """Content hash of df's values, index and columns; equal frames share a version."""
+    h = hashlib.sha1(repr((list(df.columns), [str(t) for t in df.dtypes])).encode("utf-8"))
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:
+        # Unhashable cells (e.g. JSON columns come back as dicts/lists)
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=True)
+    h.update(row_hashes.to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _cached_index(kind: str, df: pd.DataFrame, build, version: str = None):
+    """Returns build(df), computed once per DataFrame version and kept in an LRU per kind."""
+    version = version or dataframe_version(df)
+    with _index_cache_lock:
+        entries = _index_cache.setdefault(kind, OrderedDict())
+        if version in entries:
+            entries.move_to_end(version)
+            return entries[version]
+    value = build(df)
+    with _index_cache_lock:
+        entries[version] = value
+        while len(entries) > INDEX_CACHE_MAX_ENTRIES:
+            entries.popitem(last=False)
+    return value
+
+
+def _build_search_index(df: pd.DataFrame) -> pd.Series:
+    """One lowercase string per row: every cell as text, joined by a separator no query contains."""
+    lowered = [df[col].astype(str).fillna("").str.lower() for col in df.columns]
+    return reduce(lambda a, b: a + "\x1f" + b, lowered)
+
+
+def _build_distinct_index(df: pd.DataFrame) -> dict:
+    """
+    Per column: whether it is numeric, its distinct count and, for low-cardinality
+    columns, the sorted distinct values as text (what the multiselect filter shows).
+    """
+    index = {}
+    for col in df.columns:
+        series = df[col]
+        numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        try:
+            n_unique = int(series.nunique(dropna=True))
+        except TypeError:
+            series = series.astype(str)
+            n_unique = int(series.nunique(dropna=True))
+        info = {"numeric": numeric, "n_unique": n_unique, "values": None}
+        if numeric and n_unique > 1:
+            info["min"], info["max"] = series.min(), series.max()
+        elif n_unique <= FILTER_MAX_OPTIONS:
+            info["values"] = sorted(str(x) for x in series.dropna().unique())
+        index[col] = info
+    return index
+
+
+def search_mask(df: pd.DataFrame, query: str, version: str = None) -> pd.Series:
+    """
+    Rows of df containing every whitespace-separated term of query (case-insensitive).
+    A "quoted phrase" is matched as one term. Pass version when df's
+    dataframe_version is already known.
+    """
+    try:
+        terms = shlex.split(query.lower())
+    except ValueError:
+        terms = query.lower().split()
+    mask = pd.Series(True, index=df.index)
+    if not terms or len(df.columns) == 0:
+        return mask
+    index = _cached_index("search", df, _build_search_index, version)
+    for term in terms:
+        mask &= index.str.contains(term, regex=False)
+    return mask
 
 
 # -------------------------
 # 📤 Download Helpers
 # -------------------------
+def _excel_cell(value):
+    """A cell xlsxwriter can write: timedeltas as float days, containers as str (like DataFrame.to_excel)."""
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 86400
+    if isinstance(value, (dict, list, tuple, set)):
+        return str(value)
+    return value
+
+
+def write_xlsx_streaming(target, sheets: dict):
+    """
+    Writes {sheet_name: DataFrame} to target (a path or binary buffer) row by row in
+    xlsxwriter's constant_memory mode, so only the current row is held in memory.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(
+        target, {"constant_memory": True, "remove_timezone": True, "nan_inf_to_errors": True}
+    )
+    header_fmt = workbook.add_format({"bold": True})
+    date_fmt = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    try:
+        for sheet_name, df in sheets.items():
+            ws = workbook.add_worksheet(str(sheet_name)[:31])
+            ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+            date_cols = [i for i, c in enumerate(df.columns) if pd.api.types.is_datetime64_any_dtype(df[c])]
+            values = df.astype(object).where(df.notna(), None)
+            for i, c in enumerate(df.columns):
+                if df[c].dtype == object or pd.api.types.is_timedelta64_dtype(df[c]):
+                    values.iloc[:, i] = values.iloc[:, i].map(_excel_cell)
+            for r, row in enumerate(values.itertuples(index=False, name=None), start=1):
+                ws.write_row(r, 0, row)
+                for i in date_cols:
+                    if row[i] is not None:
+                        ws.write_datetime(r, i, row[i], date_fmt)
+    finally:
+        workbook.close()
+
+
+def _build_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def _build_xlsx(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    if len(df) > EXPORT_CONSTANT_MEMORY_ROWS:
+        write_xlsx_streaming(buffer, {"Sheet1": df})
+    else:
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name="Sheet1")
+    return buffer.getvalue()
+
+
+# (kind, dataframe_version) -> export bytes, most recently used last
+_export_cache = OrderedDict()
+_export_cache_lock = threading.Lock()
+_export_cache_bytes = 0
+
+
+def _cached_export(kind: str, df: pd.DataFrame, build) -> bytes:
+    """Returns build(df), cached by frame content within EXPORT_CACHE_MAX_BYTES."""
+    global _export_cache_bytes
+    key = (kind, dataframe_version(df))
+    with _export_cache_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+    data = build(df)
+    if len(data) > EXPORT_CACHE_MAX_BYTES:
+        return data
+    with _export_cache_lock:
+        if key not in _export_cache:
+            _export_cache[key] = data
+            _export_cache_bytes += len(data)
+        while _export_cache_bytes > EXPORT_CACHE_MAX_BYTES:
+            _, evicted = _export_cache.popitem(last=False)
+            _export_cache_bytes -= len(evicted)
+    return data
+
+
+def _deferred_download(container, label: str, build, **kwargs):
+    """
+    Passes build as the download data so Streamlit only calls it when the button
+    is clicked; releases without deferred downloads get the bytes up front.
+    """
+    try:
+        container.download_button(label=label, data=build, **kwargs)
+    except Exception:
+        container.download_button(label=label, data=build(), **kwargs)
+
+
 def download_button_for_df(df: pd.DataFrame, name: str):
     if df is None or df.empty:
         st.warning("⚠️ No data to download.")
         return
 
-    rand_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
-
+    # Exports are built on click and cached by frame content, so repeat downloads reuse the bytes
     col1, col2 = st.columns(2)
-    csv_data = df.to_csv(index=False).encode("utf-8")
-    col1.download_button(
-        label=f"⬇ Download {name} (CSV)",
-        data=csv_data,
+    _deferred_download(
+        col1,
+        f"⬇ Download {name} (CSV)",
+        lambda: _cached_export("csv", df, _build_csv),
         file_name=f"{name}.csv",
         mime="text/csv",
-        key=f"download_csv_{name}_{rand_suffix}",
+        key=f"download_csv_{name}",
         use_container_width=True
     )
 
-    try:
-        import xlsxwriter
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Sheet1")
-        col2.download_button(
-            label=f"⬇ Download {name} (Excel)",
-            data=excel_buffer.getvalue(),
-            file_name=f"{name}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key=f"download_xlsx_{name}_{rand_suffix}",
-            use_container_width=True
-        )
-    except Exception:
+    if importlib.util.find_spec("xlsxwriter") is None:
         col2.warning("⚠️ Excel download unavailable (install xlsxwriter)")
+        return
+    _deferred_download(
+        col2,
+        f"⬇ Download {name} (Excel)",
+        lambda: _cached_export("xlsx", df, _build_xlsx),
+        file_name=f"{name}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key=f"download_xlsx_{name}",
+        use_container_width=True
+    )
 
 
 # -------------------------
 # 🔍 Filter & Sort
 # -------------------------
+def _column_filter_mask(df: pd.DataFrame, col, info: dict, key: str):
+    """Renders the filter widget suited to col and returns its mask (None when inactive)."""
+    if info.get("min") is not None:
+        lo, hi = info["min"], info["max"]
+        if pd.api.types.is_integer_dtype(df[col]):
+            lo, hi = int(lo), int(hi)
+        else:
+            lo, hi = float(lo), float(hi)
+        selected = st.slider(f"Range of {col}", lo, hi, (lo, hi), key=f"{key}_range")
+        if tuple(selected) == (lo, hi):
+            return None
+        return df[col].between(selected[0], selected[1])
+
+    if info["values"] is not None:
+        selected_vals = st.multiselect(f"Filter {col}", info["values"], key=f"{key}_values")
+        if not selected_vals:
+            return None
+        return df[col].astype(str).isin(selected_vals)
+
+    text = st.text_input(f"{col} contains", value="", key=f"{key}_contains").lower().strip()
+    if not text:
+        return None
+    return df[col].astype(str).fillna("").str.lower().str.contains(text, regex=False)
+
+
 def filter_and_sort_dataframe(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
     if df is None or df.empty:
         st.write(f"⚠️ No data available for {table_name}")
@@ -177,26 +782,38 @@ def filter_and_sort_dataframe(df: pd.DataFrame, table_name: str) -> pd.DataFrame
         search_text = st.text_input(
             f"🔍 Global Search ({table_name})",
             value="",
-            key=f"{base_key}_search"
+            key=f"{base_key}_search",
+            help='Rows must contain every word; wrap a phrase in quotes to match it exactly.'
         ).lower().strip()
 
+        version = None
         mask = pd.Series(True, index=df.index)
         if search_text:
-            mask &= df.apply(lambda row: row.astype(str).str.lower().str.contains(search_text).any(), axis=1)
-
-        for col in df.columns:
-            unique_vals = sorted([str(x) for x in df[col].dropna().unique()])
-            options = ["(All)"] + unique_vals
-            selected_vals = st.multiselect(
-                f"Filter {col}",
-                options,
-                default=["(All)"],
-                key=f"{base_key}_{col}_filter"
-            )
-            if "(All)" not in selected_vals:
-                mask &= df[col].astype(str).isin(selected_vals)
-
-        filtered = df[mask].reset_index(drop=True)
+            version = dataframe_version(df)
+            mask &= search_mask(df, search_text, version)
+
+        # Widgets (and their option lists) are only built for the columns the user picks
+        filter_cols = st.multiselect(
+            "Filter columns",
+            list(df.columns),
+            key=f"{base_key}_filter_cols"
+        )
+        if filter_cols:
+            version = version or dataframe_version(df)
+            distinct = _cached_index("distinct", df, _build_distinct_index, version)
+            for col in filter_cols:
+                col_mask = _column_filter_mask(df, col, distinct[col], f"{base_key}_{col}_filter")
+                if col_mask is not None:
+                    mask &= col_mask
+
+        sort_col1, sort_col2 = st.columns([3, 1])
+        sort_by = sort_col1.selectbox("Sort by", ["(None)"] + list(df.columns), key=f"{base_key}_sort_by")
+        descending = sort_col2.checkbox("Descending", value=False, key=f"{base_key}_sort_desc")
+
+        filtered = df[mask]
+        if sort_by != "(None)":
+            filtered = filtered.sort_values(sort_by, ascending=not descending, kind="mergesort", na_position="last")
+        filtered = filtered.reset_index(drop=True)
         filtered.index = filtered.index + 1
 
     st.markdown(f"**📊 Showing {len(filtered)} of {len(df)} records**")
@@ -211,7 +828,7 @@ def table_exists(table: str) -> bool:
     if sb is None:
         return False
     try:
-        sb.table(table).select("id").limit(1).execute()
+        _execute(lambda c: c.table(table).select("id").limit(1))
         return True
     except Exception:
         return False
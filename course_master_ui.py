@@ -1,6 +1,6 @@
 import pandas as pd
 import streamlit as st
-from common_functions import load_table, save_table, clean_columns, download_button_for_df, filter_and_sort_dataframe
+from common_functions import load_table, save_table, save_table_changes, clean_columns, download_button_for_df, filter_and_sort_dataframe
 
 #from utils import load_table, save_table, clean_columns, download_button_for_df, filter_and_sort_dataframe  # adjust imports if needed
 
@@ -52,7 +52,8 @@ def course_master_ui(year, program):
             edited_course["AdmissionYear"] = year
         if "Program" not in edited_course.columns:
             edited_course["Program"] = program
-        save_table("Course Master", edited_course, replace_where={"AdmissionYear": year, "Program": program})
+        save_table_changes("Course Master", df_course_filtered, edited_course,
+                           replace_where={"AdmissionYear": year, "Program": program})
         st.success("✅ Course Master saved!")
         df_course = load_table("Course Master", year, program)
 
@@ -7,7 +7,7 @@ from common_functions import load_table
 def dashboard_ui(year: str, program: str):
     # --- Load Data ---
     df_course = load_table("Course Master", year, program)
-    df_col = load_table("College Master", year, program)
+    df_col = load_table("College Master", year, program, columns=["id"])  # only counted
     df_Candidate = load_table("Candidate Details", year, program)
     df_seat = load_table("Seat Matrix", year, program)
 
@@ -0,0 +1,169 @@
+# seat_batch.py
+"""
+Headless multi-round seat conversion.
+
+    python seat_batch.py INPUT_DIR OUTPUT_DIR --config config.json --engine pooled --workers 4
+    python seat_batch.py INPUT_DIR OUTPUT_DIR --engine matrix --workers 1 --partition-workers 4
+
+INPUT_DIR holds one subdirectory per program (or the round files directly, for a
+single program). Round files are ordered by the last number in their name
+(round1.xlsx, round2.xlsx, ...). Each program's rounds run in sequence with
+forward_map, lineage and the MP ledger carried forward; programs run in parallel
+processes. With --partition-workers, each loop/matrix round is itself sharded
+across that many processes (convert_seats_partitioned), which pays off when
+there are more CPUs than programs. OUTPUT_DIR/<program>/ receives the round workbooks, the program
+session (session_state.json + lineage/) and OUTPUT_DIR/timing_report.json.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import seat_conversion_logic as logic
+from seat_lineage import LINEAGE_DIR, LineageStore
+
+REPORT_FILE = "timing_report.json"
+INPUT_EXTENSIONS = (".xlsx", ".xls")
+ENGINES = ("loop", "matrix", "pooled")
+
+_NUMBER_RE = re.compile(r"(\d+)")
+
+
+def _round_key(name):
+    numbers = _NUMBER_RE.findall(os.path.splitext(name)[0])
+    return (int(numbers[-1]) if numbers else float("inf"), name)
+
+
+def find_programs(input_dir):
+    """{program name: round files in order}; round files directly in input_dir form one program."""
+    def round_files(path):
+        files = [f for f in os.listdir(path)
+                 if f.lower().endswith(INPUT_EXTENSIONS) and not f.startswith(("~$", "."))]
+        return [os.path.join(path, f) for f in sorted(files, key=_round_key)]
+
+    programs = {}
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        if os.path.isdir(path):
+            files = round_files(path)
+            if files:
+                programs[name] = files
+    direct = round_files(input_dir)
+    if direct:
+        programs[os.path.basename(os.path.normpath(input_dir)) or "program"] = direct
+    return programs
+
+
+def _convert_round(engine, path, out_dir, config, round_num, forward_map, orig_map, ledger, partition_workers=None):
+    """Converts and writes one round; returns (converted rows, forward_map, orig_map, output file)."""
+    out_file = os.path.join(out_dir, f"converted_round{round_num}.xlsx")
+    if engine == "pooled":
+        import seat_conversion_ui as pooled
+        _, converted, forward_map, orig_map = pooled.process_excel(
+            path, out_file, config, round_num, forward_map, orig_map, ledger=ledger)
+    else:
+        from common_functions import write_xlsx_streaming
+        converted, forward_map, orig_map = logic.process_excel(
+            path, config, round_num, forward_map, orig_map, engine=engine, workers=partition_workers)
+        write_xlsx_streaming(out_file + ".tmp", {f"Round{round_num}": converted})
+        os.replace(out_file + ".tmp", out_file)
+    return len(converted), forward_map, orig_map, out_file
+
+
+def run_program(task):
+    """Process-pool task: every round of one program in order. Returns its report entry."""
+    name, files, output_dir, config, engine, partition_workers = task
+    out_dir = os.path.join(output_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    orig_map = LineageStore(os.path.join(out_dir, LINEAGE_DIR))
+    orig_map.clear()
+    forward_map, ledger = {}, {}
+    report = {"program": name, "engine": engine, "rounds": [], "error": None}
+    start = time.perf_counter()
+    try:
+        for round_num, path in enumerate(files, start=1):
+            t = time.perf_counter()
+            rows, forward_map, orig_map, out_file = _convert_round(
+                engine, path, out_dir, config, round_num, forward_map, orig_map, ledger, partition_workers)
+            orig_map.save()
+            with open(os.path.join(out_dir, "session_state.json"), "w", encoding="utf-8") as f:
+                json.dump({"forward_map": forward_map, "last_round": round_num, "mp_ledger": ledger,
+                           "last_input_file": os.path.basename(path),
+                           "last_output_file": os.path.basename(out_file)}, f, indent=2)
+            report["rounds"].append({"round": round_num, "input": os.path.basename(path),
+                                     "output": os.path.basename(out_file), "rows": rows,
+                                     "seconds": round(time.perf_counter() - t, 4)})
+    except Exception as e:
+        report["error"] = f"round {len(report['rounds']) + 1}: {e}"
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
+
+
+def run_batch(input_dir, output_dir, config, engine="matrix", workers=None, partition_workers=None, log=print):
+    """Runs every program found in input_dir; writes and returns the timing report."""
+    programs = find_programs(input_dir)
+    if not programs:
+        raise ValueError(f"No round input files found in {input_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(programs)))
+    tasks = [(name, files, output_dir, config, engine, partition_workers) for name, files in programs.items()]
+
+    start = time.perf_counter()
+    if workers == 1:
+        reports = [run_program(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            reports = list(pool.map(run_program, tasks))
+    for report in reports:
+        if log:
+            status = f"❌ {report['error']}" if report["error"] else "ok"
+            log(f"{report['program']}: {len(report['rounds'])} round(s) in {report['seconds']:.2f}s {status}")
+
+    summary = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "input_dir": os.path.abspath(input_dir),
+        "engine": engine,
+        "workers": workers,
+        "partition_workers": partition_workers,
+        "config_hash": logic.config_hash(config),
+        "seconds": round(time.perf_counter() - start, 4),
+        "programs": reports,
+    }
+    with open(os.path.join(output_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run multi-round seat conversion without the Streamlit UI.")
+    parser.add_argument("input_dir", help="directory of round input files, or of one subdirectory per program")
+    parser.add_argument("output_dir")
+    parser.add_argument("--config", help="rules JSON (default: config.json or the built-in rules)")
+    parser.add_argument("--engine", choices=ENGINES, default="matrix",
+                        help="loop/matrix: seat_conversion_logic, pooled: seat_conversion_ui")
+    parser.add_argument("--workers", type=int, default=None, help="parallel programs (default: CPU count)")
+    parser.add_argument("--partition-workers", type=int, default=None,
+                        help="processes per loop/matrix round, sharded by Stream/Course (default: none)")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        config = logic.read_config_file(args.config)
+    elif args.engine == "pooled":
+        import seat_conversion_ui as pooled
+        config = pooled.load_config()
+    else:
+        config = logic.load_config()
+
+    summary = run_batch(args.input_dir, args.output_dir, config, args.engine, args.workers, args.partition_workers)
+    failed = [r for r in summary["programs"] if r["error"]]
+    print(f"{len(summary['programs'])} program(s) in {summary['seconds']:.2f}s with {summary['workers']} worker(s); "
+          f"report: {os.path.join(args.output_dir, REPORT_FILE)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# seat_benchmark.py
+"""
+Synthetic seat matrices and a timing harness for the seat conversion engines.
+
+    python seat_benchmark.py --sizes 50 200 800 --rounds 2 --output seat_benchmark.json
+
+Each run appends one entry (environment + per stage timings) to the JSON file,
+and --compare prints the change against the previous entry.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import seat_conversion_logic as logic
+
+BENCHMARK_FILE = "seat_benchmark.json"
+
+# Share of seats per category in a typical statewide matrix
+DEFAULT_CATEGORY_MIX = {
+    "SM": 0.40, "EW": 0.10, "EZ": 0.09, "MU": 0.08, "SC": 0.08, "ST": 0.02,
+    "OE": 0.03, "SD": 0.02, "HR": 0.01, "DK": 0.01, "XS": 0.02, "PD": 0.03,
+    "BH": 0.02, "LA": 0.02, "DV": 0.02, "VK": 0.01, "KN": 0.01, "BX": 0.01,
+    "KU": 0.01, "MG": 0.02, "PI": 0.005, "PT": 0.005,
+}
+
+# ---------------------------
+# Synthetic Seat Matrix
+# ---------------------------
+def generate_seat_matrix(streams="EMA", inst_types="GSP", courses=20, colleges=100,
+                         category_mix=None, courses_per_college=6, seats_per_course=(30, 120), seed=0):
+    """
+    Logic-engine input: one row per stream/college/course/category with an
+    11-character seat code (stream, inst type, 2-digit course, 3-digit college,
+    4-character category field) and its seat count.
+    """
+    rng = np.random.default_rng(seed)
+    mix = category_mix or DEFAULT_CATEGORY_MIX
+    cats = np.array(list(mix.keys()))
+    weights = np.array(list(mix.values()), dtype=float)
+    weights = weights / weights.sum()
+
+    # Every stream/college offers a few courses, each with a total intake
+    offer_stream = np.repeat(np.array(list(streams)), colleges)
+    offer_college = np.tile(np.arange(colleges), len(streams))
+    offer_inst = np.array(list(inst_types))[rng.integers(0, len(inst_types), colleges)][offer_college]
+    per_college = min(courses_per_college, courses)
+    course_ids = np.argsort(rng.random((len(offer_college), courses)), axis=1)[:, :per_college]
+    intake = rng.integers(seats_per_course[0], seats_per_course[1] + 1, course_ids.shape)
+
+    # Intake split by category mix; categories that round to zero seats are dropped
+    seats = np.floor(intake[:, :, None] * weights[None, None, :] * rng.uniform(0.6, 1.4, (*intake.shape, len(cats))))
+    o, c, k = np.nonzero(seats > 0)
+    # Category field: right-aligned code, sometimes with a 2-character prefix or lower case
+    field = np.char.rjust(cats[k], 4)
+    prefixed = rng.random(len(k)) < 0.1
+    field[prefixed] = np.char.add("NR", cats[k][prefixed])
+    lowered = rng.random(len(k)) < 0.02
+    field[lowered] = np.char.lower(field[lowered])
+
+    codes = (pd.Series(offer_stream[o]) + pd.Series(offer_inst[o])
+             + pd.Series(course_ids[o, c]).map("{:02d}".format)
+             + pd.Series(offer_college[o]).map("{:03d}".format) + pd.Series(field))
+    return pd.DataFrame({"Code": codes, "Seats": seats[o, c, k].astype(np.int64)})
+
+
+def generate_rounds(rounds=2, vacancy_rate=0.35, seed=0, **matrix_args):
+    """
+    Round inputs: the full matrix, then for each later round the vacancies left
+    from a random subset of the previous round's rows.
+    """
+    rng = np.random.default_rng(seed + 1)
+    df = generate_seat_matrix(seed=seed, **matrix_args)
+    inputs = [df]
+    for _ in range(1, rounds):
+        keep = rng.random(len(df)) < vacancy_rate
+        df = df[keep].copy()
+        df["Seats"] = np.maximum(1, (df["Seats"] * rng.uniform(0.05, 0.5, len(df))).astype(np.int64))
+        inputs.append(df.reset_index(drop=True))
+    return inputs
+
+
+def to_pooled_input(df):
+    """The same matrix in the column layout seat_conversion_ui.process_excel reads."""
+    parsed = logic.parse_codes(df["Code"])
+    return pd.DataFrame({
+        "C": parsed["Stream"], "CollegeType": parsed["InstType"], "CourseCode": parsed["Course"],
+        "CollegeCode": parsed["College"], "Category": parsed["Category"], "Seat": df["Seats"],
+    })
+
+
+def _xlsx_bytes(df):
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine="xlsxwriter")
+    return buf.getvalue()
+
+# ---------------------------
+# Harness
+# ---------------------------
+def _timed(fn, repeat):
+    """Best wall time of repeat runs and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _logic_stages(xlsx, config, round_num, forward_map, orig_map, engine, repeat):
+    """parse / convert / write / process_excel timings of seat_conversion_logic."""
+    def parse():
+        df = pd.read_excel(io.BytesIO(xlsx), engine="openpyxl")
+        parsed = logic.parse_codes(df.iloc[:, 0])
+        return pd.concat([parsed, df.iloc[:, 1].astype(int).rename("Seats")], axis=1)
+
+    t_parse, parsed = _timed(parse, repeat)
+    initial = parsed[["Stream", "InstType", "Course", "College", "Category", "Seats"]]
+    t_convert, (converted, _, _) = _timed(
+        lambda: logic.convert_seats(initial, config, dict(forward_map), dict(orig_map), engine=engine), repeat)
+
+    def write():
+        # The Round{n} download seat_conversion1 builds from the round's output
+        buf = io.BytesIO()
+        with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+            converted.assign(Round=round_num).to_excel(writer, sheet_name=f"Round{round_num}", index=False)
+        return buf
+
+    t_write, _ = _timed(write, repeat)
+    t_total, result = _timed(lambda: logic.process_excel(
+        io.BytesIO(xlsx), config, round_num, dict(forward_map), dict(orig_map), engine=engine), repeat)
+    return {"parse": t_parse, "convert": t_convert, "write": t_write, "total": t_total}, result
+
+
+def _pooled_stages(xlsx, config, round_num, forward_map, orig_map, repeat):
+    """parse / convert / write / process_excel timings of seat_conversion_ui (pooled engine)."""
+    import seat_conversion_ui as pooled
+    from common_functions import write_xlsx_streaming
+
+    def parse():
+        df = pd.read_excel(io.BytesIO(xlsx), engine="openpyxl")
+        return df, df.rename(columns={"C": "Stream", "CollegeType": "InstType", "CollegeCode": "College",
+                                      "CourseCode": "Course", "Seat": "Seats"})
+
+    t_parse, (raw, work_df) = _timed(parse, repeat)
+    work_df = work_df[["Stream", "InstType", "Course", "College", "Category", "Seats"]]
+    t_convert, (converted, _, _) = _timed(
+        lambda: pooled.convert_seats(work_df, config, dict(forward_map), dict(orig_map)), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def write():
+            # The same sheets and writer as process_excel
+            detailed = converted.assign(Round=round_num)
+            write_xlsx_streaming(os.path.join(tmp, "write.xlsx"), {
+                "InputData": raw,
+                f"ConvertedRound{round_num}": detailed,
+                f"SummaryRound{round_num}": pooled.summary_frame(detailed),
+            })
+            return None
+
+        def total():
+            out = os.path.join(tmp, "total.xlsx")
+            if os.path.exists(out):
+                os.remove(out)
+            return pooled.process_excel(io.BytesIO(xlsx), out, config, round_num, dict(forward_map), dict(orig_map))
+
+        t_write, _ = _timed(write, repeat)
+        t_total, result = _timed(total, repeat)
+    return {"parse": t_parse, "convert": t_convert, "write": t_write, "total": t_total}, result
+
+
+def run_benchmark(sizes=(50, 200), rounds=2, repeat=1, engines=("loop", "matrix", "pooled"),
+                  config=None, seed=0, log=print):
+    """
+    Times every engine on synthetic matrices of each size (number of colleges per
+    stream), round by round with lineage carried forward. Returns a JSON-ready dict.
+    """
+    config = config or logic.load_config()
+    results = []
+    for size in sizes:
+        inputs = generate_rounds(rounds=rounds, colleges=size, seed=seed)
+        lineage = {engine: ({}, {}) for engine in engines}
+        for round_num, df in enumerate(inputs, start=1):
+            logic_xlsx = _xlsx_bytes(df)
+            pooled_xlsx = _xlsx_bytes(to_pooled_input(df)) if "pooled" in engines else None
+            for engine in engines:
+                forward_map, orig_map = lineage[engine]
+                if engine == "pooled":
+                    stages, (_, converted, forward_map, orig_map) = _pooled_stages(
+                        pooled_xlsx, config, round_num, forward_map, orig_map, repeat)
+                else:
+                    stages, (converted, forward_map, orig_map) = _logic_stages(
+                        logic_xlsx, config, round_num, forward_map, orig_map, engine, repeat)
+                lineage[engine] = (forward_map, orig_map)
+                for stage, seconds in stages.items():
+                    results.append({"size": size, "rows": len(df), "round": round_num, "engine": engine,
+                                    "stage": stage, "seconds": round(seconds, 6), "output_rows": len(converted)})
+                if log:
+                    log(f"size={size} rows={len(df)} round={round_num} {engine}: "
+                        + ", ".join(f"{k}={v:.3f}s" for k, v in stages.items()))
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": {"sizes": list(sizes), "rounds": rounds, "repeat": repeat, "engines": list(engines), "seed": seed},
+        "results": results,
+    }
+
+
+def save_results(report, path=BENCHMARK_FILE):
+    """Appends the run to the JSON history file."""
+    history = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    history.append(report)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    return history
+
+
+def compare_results(previous, current):
+    """Per size/round/engine/stage: previous and current seconds and their ratio."""
+    key = ["size", "round", "engine", "stage"]
+    before = pd.DataFrame(previous["results"])
+    after = pd.DataFrame(current["results"])
+    if before.empty or after.empty:
+        return pd.DataFrame()
+    merged = before[key + ["seconds"]].merge(after[key + ["seconds"]], on=key, suffixes=("_before", "_after"))
+    merged["ratio"] = (merged["seconds_after"] / merged["seconds_before"]).round(2)
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the seat conversion engines on synthetic seat matrices.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200], help="colleges per stream")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the best time is kept")
+    parser.add_argument("--engines", nargs="+", default=["loop", "matrix", "pooled"],
+                        choices=["loop", "matrix", "pooled"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=BENCHMARK_FILE)
+    parser.add_argument("--compare", action="store_true", help="print the change against the previous run")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.sizes, args.rounds, args.repeat, args.engines, seed=args.seed)
+    history = save_results(report, args.output)
+    print(f"Saved {len(report['results'])} timings to {args.output}")
+    if args.compare and len(history) > 1:
+        print(compare_results(history[-2], history[-1]).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,8 @@ import io
 import json
 import pandas as pd
 import streamlit as st
-from seat_conversion_logic import load_config, save_config, init_session, process_excel, flush_session
+from seat_conversion_logic import (load_config, save_config, init_session, record_round, process_excel, flush_session,
+                                   read_seat_matrix, scenario_config, simulate_scenarios)
 
 def seat_conversion_ui():
     st.set_page_config(page_title="Seat Conversion Dashboard", layout="wide")
@@ -31,51 +32,63 @@ def seat_conversion_ui():
         with col1:
             if uploaded and st.button("▶️ Run Conversion", type="primary"):
                 try:
+                    stats = {}
                     converted, fwd_map, orig_map = process_excel(
                         uploaded, config, current_round,
                         forward_map=st.session_state.get("forward_map", {}),
-                        orig_map=st.session_state.get("orig_map", {})
+                        orig_map=st.session_state.get("orig_map", {}),
+                        cache=st.session_state.setdefault("conversion_cache", {}),
+                        stats=stats
                     )
-                    # Update session state
-                    st.session_state.forward_map = fwd_map
-                    st.session_state.orig_map = orig_map
-                    st.session_state.last_round = current_round
-                    st.session_state.converted = converted.copy()  # Latest conversion
-
-                    # Save history
-                    if "history" not in st.session_state:
-                        st.session_state.history = {}
-                    st.session_state.history[current_round] = converted.copy()
+                    # Update session state and its history on disk (the latest round is read back from there)
+                    record_round(current_round, converted, fwd_map, orig_map)
 
                     st.success(f"✅ Round {current_round} conversion completed!")
+                    st.caption(f"♻️ {stats['reused']} of {stats['groups']} groups reused, "
+                               f"{stats['recomputed']} recomputed ({stats['seconds']:.2f}s)")
                 except Exception as e:
                     st.error(f"❌ Error: {e}")
 
         with col2:
             if st.button("🗑️ Clear Conversion Session"):
                 flush_session()
-                st.session_state.forward_map = {}
-                st.session_state.orig_map = {}
-                st.session_state.last_round = 0
-                st.session_state.pop("converted", None)
-                st.session_state.pop("history", None)
                 st.success("✅ Session cleared. Ready for fresh round.")
 
+        # What-if: the uploaded matrix under several rule variants, category totals side by side
+        with st.expander("🧪 What-if Scenarios"):
+            st.caption('JSON object of scenario name → rule overrides, e.g. '
+                       '{"MP 60% SM": {"mp_distribution": {...}}, "SC ladder": {"ladders": {...}}}')
+            scenarios_text = st.text_area("Scenarios", value="{}", height=160, key="whatif_scenarios")
+            if uploaded and st.button("🧪 Compare Scenarios"):
+                try:
+                    overrides = json.loads(scenarios_text)
+                    scenarios = {"Current": config}
+                    scenarios.update((name, scenario_config(config, **o)) for name, o in overrides.items())
+                    uploaded.seek(0)
+                    comparison = simulate_scenarios(read_seat_matrix(uploaded), scenarios,
+                                                    forward_map=st.session_state.get("forward_map", {}))
+                    uploaded.seek(0)
+                    st.dataframe(comparison, use_container_width=True)
+                except Exception as e:
+                    st.error(f"❌ Error: {e}")
+
     # -------------------------
     # Tab 2: Converted Data
     # -------------------------
     with tabs[1]:
         # Show latest converted data
-        if "converted" in st.session_state and st.session_state.converted is not None:
-            st.subheader(f"📊 Converted Data - Round {st.session_state.get('last_round', current_round)}")
+        last_round = st.session_state.get("last_round", 0)
+        if last_round and last_round in st.session_state.history:
+            converted = st.session_state.history.load(last_round)
+            st.subheader(f"📊 Converted Data - Round {last_round}")
             st.dataframe(
-                st.session_state.converted.style.highlight_max(axis=0, color="#dff0d8"),
+                converted.style.highlight_max(axis=0, color="#dff0d8"),
                 use_container_width=True
             )
 
             out_buffer = io.BytesIO()
             with pd.ExcelWriter(out_buffer, engine="openpyxl") as writer:
-                st.session_state.converted.to_excel(writer, sheet_name=f"Round{st.session_state.last_round}", index=False)
+                converted.to_excel(writer, sheet_name=f"Round{last_round}", index=False)
             st.download_button(
                 "⬇️ Download Converted Excel",
                 data=out_buffer.getvalue(),
@@ -173,11 +186,14 @@ def seat_conversion_ui():
     # Tab 4: Conversion History
     # -------------------------
     with tabs[3]:
-        if "history" in st.session_state and st.session_state.history:
-            rounds = sorted(st.session_state.history.keys(), reverse=True)
+        history = st.session_state.history
+        if history:
+            rounds = history.rounds(reverse=True)
             selected_round = st.selectbox("Select Round", rounds, index=0)
-            df_round = st.session_state.history[selected_round]
+            meta = history.info(selected_round)
             st.subheader(f"📊 Conversion History - Round {selected_round}")
+            st.caption(f"{meta['rows']} rows · saved {meta['saved']} · {meta['bytes'] / 1024:.1f} KB on disk")
+            df_round = history.load(selected_round)
             st.dataframe(df_round.style.highlight_max(axis=0, color="#dff0d8"), use_container_width=True)
 
             # Download button for selected round
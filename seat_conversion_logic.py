@@ -1,18 +1,66 @@
 # seat_conversion_logic.py
 import os
+import copy
 import json
-import math
+import time
+import re
+import hashlib
+import uuid
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
+
+import numpy as np
 import pandas as pd
 
+from seat_lineage import LINEAGE_DIR, LineageStore
+from seat_history import prune_history, session_history
+
 CONFIG_FILE = "config.json"
+PLAN_CACHE_MAX_ENTRIES = 16
+
+# Conversion session ids (the ?session= URL parameter) name history directories
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+DEFAULT_MP = {
+    "SM": 0.50, "EWS": 0.10,
+    "EZ": 0.09, "MU": 0.08, "BH": 0.03, "LA": 0.03,
+    "DV": 0.02, "VK": 0.02, "KN": 0.01, "BX": 0.01, "KU": 0.01,
+    "SC": 0.08, "ST": 0.02
+}
 
 # ---------------------------
 # Configuration
 # ---------------------------
+# path -> ((mtime_ns, size), sha1 of bytes, parsed config)
+_config_cache = {}
+
+
+def read_config_file(path):
+    """
+    json.load of a config file, parsed again only when its mtime/size and content
+    hash change. Returns a copy, so callers may edit it freely.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != stamp:
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if cached is None or cached[1] != digest:
+            cached = (stamp, digest, json.loads(raw.decode("utf-8")))
+        else:
+            cached = (stamp, digest, cached[2])
+        _config_cache[path] = cached
+    return copy.deepcopy(cached[2])
+
+
 def load_config():
     if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return read_config_file(CONFIG_FILE)
     return {
         "no_conversion": ["MG", "EW"],
         "direct_to_sm": ["EZ", "MU", "BX", "LA", "BH", "DV", "VK", "KN", "KU"],
@@ -37,19 +85,168 @@ def load_config():
 def save_config(cfg):
     with open(CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(cfg, f, indent=2)
+    _config_cache.pop(CONFIG_FILE, None)
+
+# ---------------------------
+# Compiled Rule Plan
+# ---------------------------
+# Fixed conversions applied before the configurable rules: (source, target, reason)
+FIXED_CONVERSIONS = (("OE", "SM", "OE_to_SM"), ("SD", "XS", "SD_to_XS"), ("HR", "XS", "HR_to_SD_to_XS"))
+
+
+@dataclass(frozen=True)
+class RulePlan:
+    """
+    Conversion rules of one config version, normalized and validated once.
+
+    transitions maps each ladder source to ((target, guarded), ...): guarded steps
+    are the ones whose reverse step is also a ladder (e.g. SC <-> ST), the only
+    places where forward_map has to be consulted.
+    """
+    key: str
+    categories: tuple
+    cat_id: MappingProxyType
+    ladders: MappingProxyType
+    transitions: MappingProxyType
+    ladder_cycles: frozenset
+    direct_to_mp: tuple
+    direct_to_sm: tuple
+    swap_pairs: tuple
+    no_conversion: tuple
+    mp_frac: MappingProxyType
+
+    def __reduce__(self):
+        # MappingProxyType does not pickle; process-pool workers get plain dicts
+        fields = {k: dict(v) if isinstance(v, MappingProxyType) else v for k, v in self.__dict__.items()}
+        return _restore_plan, (fields,)
+
+
+def _restore_plan(fields):
+    return RulePlan(**{k: MappingProxyType(v) if isinstance(v, dict) else v for k, v in fields.items()})
+
+
+# config hash -> RulePlan, most recently used last
+_plan_cache = OrderedDict()
+
+
+def config_hash(config):
+    """Content hash of a config dict, independent of key order."""
+    text = json.dumps(config or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _category_list(config, name):
+    values = config.get(name, [])
+    if not isinstance(values, (list, tuple)) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"Config '{name}' must be a list of category codes")
+    return tuple(v.strip().upper() for v in values)
+
+
+def _compile_rules(config, key):
+    raw_ladders = config.get("ladders", {})
+    if not isinstance(raw_ladders, dict):
+        raise ValueError("Config 'ladders' must map a category to a list of targets")
+    ladders = {}
+    for src, steps in raw_ladders.items():
+        if not isinstance(steps, (list, tuple)) or not all(isinstance(t, str) for t in [src, *steps]):
+            raise ValueError(f"Ladder for '{src}' must be a list of category codes")
+        steps = tuple(dict.fromkeys(t.strip().upper() for t in steps))
+        if steps:
+            ladders[src.strip().upper()] = steps
+
+    swap_pairs = []
+    for pair in config.get("swap_pairs", []):
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2 or not all(isinstance(c, str) for c in pair):
+            raise ValueError(f"Swap pair {pair!r} must be two category codes")
+        swap_pairs.append((pair[0].strip().upper(), pair[1].strip().upper()))
+
+    # A step is never taken back to its own source, and a step src -> dst can only
+    # be blocked by forward_map when dst -> src is a ladder step as well
+    ladder_cycles = frozenset((src, dst) for src, steps in ladders.items() for dst in steps
+                              if dst != src and src in ladders.get(dst, ()))
+    transitions = {src: tuple((dst, (src, dst) in ladder_cycles) for dst in steps if dst != src)
+                   for src, steps in ladders.items()}
+
+    mp_frac = _mp_fractions(config)
+    direct_to_mp = _category_list(config, "direct_to_mp")
+    direct_to_sm = _category_list(config, "direct_to_sm")
+    categories = tuple(dict.fromkeys(
+        [c for step in FIXED_CONVERSIONS for c in step[:2]] + list(direct_to_mp) + list(direct_to_sm)
+        + [c for pair in swap_pairs for c in pair] + list(ladders) + [t for v in ladders.values() for t in v]
+        + list(mp_frac)
+    ))
+    return RulePlan(
+        key=key,
+        categories=categories,
+        cat_id=MappingProxyType({c: i for i, c in enumerate(categories)}),
+        ladders=MappingProxyType(ladders),
+        transitions=MappingProxyType(transitions),
+        ladder_cycles=ladder_cycles,
+        direct_to_mp=direct_to_mp,
+        direct_to_sm=direct_to_sm,
+        swap_pairs=tuple(swap_pairs),
+        no_conversion=_category_list(config, "no_conversion"),
+        mp_frac=MappingProxyType(dict(mp_frac)),
+    )
+
+
+def compile_rules(config):
+    """RulePlan for a config dict, compiled once per distinct config content."""
+    if isinstance(config, RulePlan):
+        return config
+    key = config_hash(config)
+    plan = _plan_cache.get(key)
+    if plan is None:
+        plan = _compile_rules(config or {}, key)
+        _plan_cache[key] = plan
+        while len(_plan_cache) > PLAN_CACHE_MAX_ENTRIES:
+            _plan_cache.popitem(last=False)
+    else:
+        _plan_cache.move_to_end(key)
+    return plan
 
 # ---------------------------
 # Session Initialization
 # ---------------------------
 def init_session():
+    """
+    Opens the conversion session named by the page URL's ?session= id, or starts a
+    new one. The id stays in the URL, so a reload or a server restart reopens the
+    same history directory and resumes its forward_map, lineage and last round.
+    """
     import streamlit as st
+    if "history" not in st.session_state:
+        prune_history()
+        session_id = st.query_params.get("session", "")
+        if not SESSION_ID_RE.match(session_id):
+            session_id = uuid.uuid4().hex
+            st.query_params["session"] = session_id
+        history = session_history(session_id)
+        state = history.load_state()
+        st.session_state.history = history
+        st.session_state.forward_map = state.get("forward_map", {})
+        st.session_state.orig_map = LineageStore(os.path.join(history.path, LINEAGE_DIR))
+        st.session_state.last_round = state.get("last_round", 0)
     if "forward_map" not in st.session_state:
         st.session_state.forward_map = {}
     if "orig_map" not in st.session_state:
-        st.session_state.orig_map = {}
+        st.session_state.orig_map = LineageStore()
     if "last_round" not in st.session_state:
         st.session_state.last_round = 0
 
+
+def record_round(round_num, converted, forward_map, orig_map):
+    """Makes round_num the session's last round and writes it, its lineage and forward_map to the history."""
+    import streamlit as st
+    st.session_state.forward_map = forward_map
+    st.session_state.orig_map = orig_map
+    st.session_state.last_round = round_num
+    history = st.session_state.history
+    history.save(round_num, converted)
+    if isinstance(orig_map, LineageStore):
+        orig_map.save()
+    history.save_state(forward_map=forward_map, last_round=round_num)
+
 # ---------------------------
 # Helper Functions
 # ---------------------------
@@ -74,237 +271,308 @@ def parse_code(code):
         "Category": cat
     }
 
+def parse_codes(codes):
+    """
+    Vectorized parse_code over a Series of seat codes: one fixed-width split per
+    column instead of a dict and a Series per row. Returns the same columns,
+    values and index as codes.apply(parse_code).apply(pd.Series).
+    """
+    codes = pd.Series(codes)
+    # Object dtype keeps Python's own str semantics (e.g. unicode upper-casing)
+    s = codes.astype(object).where(codes.notna(), "").astype(str).astype(object)
+    s = s.str.rstrip("\n\r").str.pad(11, side="right", fillchar=" ")
+    cat_raw = s.str.slice(7, 11)
+    return pd.DataFrame({
+        "Stream": s.str.slice(0, 1),
+        "InstType": s.str.slice(1, 2),
+        "Course": s.str.slice(2, 4),
+        "College": s.str.slice(4, 7),
+        "CategoryRaw": cat_raw,
+        # Last two characters once stripped; shorter categories are kept whole
+        "Category": cat_raw.str.strip().str.upper().str.slice(-2),
+    }, index=codes.index)
+
 # ---------------------------
 # Seat Conversion Core Logic
 # ---------------------------
-def distribute_to_mp(seats, source_cat, config):
-    DEFAULT_MP = {
-        "SM": 0.50, "EWS": 0.10,
-        "EZ": 0.09, "MU": 0.08, "BH": 0.03, "LA": 0.03,
-        "DV": 0.02, "VK": 0.02, "KN": 0.01, "BX": 0.01, "KU": 0.01,
-        "SC": 0.08, "ST": 0.02
-    }
+def _mp_fractions(config):
+    """Normalized MP distribution, exactly as distribute_to_mp computes it."""
+    if isinstance(config, RulePlan):
+        return config.mp_frac
     mp_rules = config.get("mp_distribution") or DEFAULT_MP
     total = sum(mp_rules.values()) if isinstance(mp_rules, dict) else 0
-    mp_frac = {k: v / total for k, v in mp_rules.items()} if total > 0 else DEFAULT_MP
+    return {k: v / total for k, v in mp_rules.items()} if total > 0 else DEFAULT_MP
 
-    floats = {cat: seats * frac for cat, frac in mp_frac.items()}
-    floors = {cat: int(math.floor(v)) for cat, v in floats.items()}
-    allocated = sum(floors.values())
-    extra = seats - allocated
-    remainders = [(cat, floats[cat] - floors[cat]) for cat in mp_frac.keys()]
-    remainders.sort(key=lambda x: (-x[1], list(mp_frac.keys()).index(x[0])))
 
-    for i in range(extra):
-        cat = remainders[i % len(remainders)][0]
-        floors[cat] += 1
+def _protect_half(alloc, effective, order, total):
+    """
+    Pooled-engine fix-up for one row: every category expecting at least half a seat
+    gets one, then seats are taken back from the smallest remainders (or handed out
+    by largest remainder) until the row sums to total again.
+    """
+    alloc = [int(a) for a in alloc]
+    protected = {j for j in range(len(alloc)) if effective[j] >= 0.5 and alloc[j] == 0}
+    for j in protected:
+        alloc[j] = 1
+    while sum(alloc) > total:
+        for j in reversed(order):
+            if j not in protected and alloc[j] > 0:
+                alloc[j] -= 1
+                break
+        else:
+            break
+    while sum(alloc) < total:
+        for j in order:
+            alloc[j] += 1
+            if sum(alloc) >= total:
+                break
+    return alloc
 
+
+def apportion_seats(seats, fractions, carry=None, tie_order=None, protect_half=False):
+    """
+    Largest-remainder apportionment of many seat totals in one pass.
+
+    seats: (n,) totals, fractions: (k,) category shares, carry: optional (n, k)
+    remainders added to each expected share. Equal remainders go to the category
+    earlier in tie_order (default: position) and leftover seats cycle through the
+    remainder order. protect_half applies the pooled engine's rule that a category
+    expecting >= 0.5 seats gets at least one.
+    Returns (alloc, effective): (n, k) int allocations and expected shares.
+    """
+    seats = np.asarray(seats, dtype=np.int64).reshape(-1)
+    fractions = np.asarray(fractions, dtype=float).reshape(-1)
+    n, k = len(seats), len(fractions)
+    effective = seats[:, None].astype(float) * fractions[None, :]
+    if carry is not None:
+        effective = effective + np.asarray(carry, dtype=float).reshape(n, k)
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.int64), effective
+
+    alloc = np.floor(effective).astype(np.int64)
+    tie_order = np.arange(k) if tie_order is None else np.asarray(tie_order, dtype=np.int64)
+    order = tie_order[np.argsort(-(effective - alloc)[:, tie_order], axis=1, kind="stable")]
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(k), order.shape).copy(), axis=1)
+    extra = np.maximum(seats - alloc.sum(axis=1), 0)
+    alloc = alloc + extra[:, None] // k + (rank < (extra % k)[:, None])
+
+    if protect_half:
+        fix = ((effective >= 0.5) & (alloc == 0)).any(axis=1) | (alloc.sum(axis=1) != seats)
+        for i in np.flatnonzero(fix):
+            alloc[i] = _protect_half(alloc[i], effective[i], order[i].tolist(), int(seats[i]))
+    return alloc, effective
+
+
+def distribute_to_mp(seats, source_cat, config):
+    mp_frac = _mp_fractions(config)
+    alloc, _ = apportion_seats([seats], list(mp_frac.values()))
     rows = []
-    for cat, cnt in floors.items():
+    for cat, cnt in zip(mp_frac.keys(), alloc[0].tolist()):
         if cnt > 0:
             rows.append({"Category": cat, "Seats": int(cnt), "ConvertedFrom": source_cat})
     return rows
 
-def convert_seats(df, config, forward_map=None, orig_map=None):
-    df = df.copy()
-    df["Category"] = df["Category"].astype(str).str.strip().str.upper()
-    df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
-
-    ladders = {k.strip().upper(): [x.strip().upper() for x in v] for k, v in config.get("ladders", {}).items()}
-    direct_to_mp = [c.strip().upper() for c in config.get("direct_to_mp", [])]
-    direct_to_sm = [c.strip().upper() for c in config.get("direct_to_sm", [])]
-    swap_pairs = [(a.strip().upper(), b.strip().upper()) for a, b in config.get("swap_pairs", [])]
-    no_conversion = [c.strip().upper() for c in config.get("no_conversion", [])]
+def _convert_group(group_vals, seats_by_cat, orig_cats, plan, forward_map, orig_map, results):
+    """Applies the rule plan to one Stream/InstType/Course/College group, appending output rows to results."""
+    direct_to_mp, direct_to_sm = plan.direct_to_mp, plan.direct_to_sm
+    swap_pairs, no_conversion = plan.swap_pairs, plan.no_conversion
+    stream, inst, course, college = group_vals
+    handled = set()
+    converted_targets = set()
 
-    if forward_map is None:
-        forward_map = {}
-    if orig_map is None:
-        orig_map = {}
+    group_prefix = f"{stream}-{inst}-{course}-{college}"
 
-    results = []
-    group_keys = ["Stream", "InstType", "Course", "College"]
-    grouped = df.groupby(group_keys, sort=False)
+    for cat in orig_cats:
+        k = f"{group_prefix}-{cat}"
+        if k not in orig_map:
+            orig_map[k] = cat
 
-    for group_vals, group in grouped:
-        stream, inst, course, college = group_vals
-        seats_by_cat = group.groupby("Category", sort=False)["Seats"].sum().to_dict()
-        orig_cats = list(group["Category"].unique())
-        handled = set()
-        converted_targets = set()
+    # OE -> SM
+    if seats_by_cat.get("OE", 0) > 0:
+        oe_seats = seats_by_cat["OE"]
+        source_key = f"{group_prefix}-OE"
+        orig_cat_value = orig_map.get(source_key, "OE")
+        results.append({
+            "Stream": stream, "InstType": inst, "Course": course, "College": college,
+            "OriginalCategory": orig_cat_value,
+            "Category": "SM", "Seats": oe_seats,
+            "ConvertedFrom": "OE", "ConversionFlag": "Y", "ConversionReason": "OE_to_SM"
+        })
+        targ_key = f"{group_prefix}-SM"
+        if targ_key not in orig_map:
+            orig_map[targ_key] = orig_cat_value
+        handled.add("OE")
+        seats_by_cat["OE"] = 0
+        seats_by_cat["SM"] = seats_by_cat.get("SM", 0) + oe_seats
 
-        group_prefix = f"{stream}-{inst}-{course}-{college}"
+    # SD -> XS
+    if seats_by_cat.get("SD", 0) > 0:
+        sd_seats = seats_by_cat["SD"]
+        source_key = f"{group_prefix}-SD"
+        orig_cat_value = orig_map.get(source_key, "SD")
+        results.append({
+            "Stream": stream, "InstType": inst, "Course": course, "College": college,
+            "OriginalCategory": orig_cat_value,
+            "Category": "XS", "Seats": sd_seats,
+            "ConvertedFrom": "SD", "ConversionFlag": "Y", "ConversionReason": "SD_to_XS"
+        })
+        targ_key = f"{group_prefix}-XS"
+        if targ_key not in orig_map:
+            orig_map[targ_key] = orig_cat_value
+        handled.add("SD")
+        seats_by_cat["SD"] = 0
+        seats_by_cat["XS"] = seats_by_cat.get("XS", 0) + sd_seats
 
-        for cat in orig_cats:
-            k = f"{group_prefix}-{cat}"
-            if k not in orig_map:
-                orig_map[k] = cat
+    # HR -> SD -> XS
+    if seats_by_cat.get("HR", 0) > 0:
+        hr_seats = seats_by_cat["HR"]
+        source_key = f"{group_prefix}-HR"
+        orig_cat_value = orig_map.get(source_key, "HR")
+        results.append({
+            "Stream": stream, "InstType": inst, "Course": course, "College": college,
+            "OriginalCategory": orig_cat_value,
+            "Category": "XS", "Seats": hr_seats,
+            "ConvertedFrom": "HR", "ConversionFlag": "Y", "ConversionReason": "HR_to_SD_to_XS"
+        })
+        targ_key = f"{group_prefix}-XS"
+        if targ_key not in orig_map:
+            orig_map[targ_key] = orig_cat_value
+        handled.add("HR")
+        seats_by_cat["HR"] = 0
+        seats_by_cat["XS"] = seats_by_cat.get("XS", 0) + hr_seats
 
-        # OE -> SM
-        if seats_by_cat.get("OE", 0) > 0:
-            oe_seats = seats_by_cat["OE"]
-            source_key = f"{group_prefix}-OE"
-            orig_cat_value = orig_map.get(source_key, "OE")
-            results.append({
-                "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                "OriginalCategory": orig_cat_value,
-                "Category": "SM", "Seats": oe_seats,
-                "ConvertedFrom": "OE", "ConversionFlag": "Y", "ConversionReason": "OE_to_SM"
-            })
-            targ_key = f"{group_prefix}-SM"
-            if targ_key not in orig_map:
-                orig_map[targ_key] = orig_cat_value
-            handled.add("OE")
-            seats_by_cat["OE"] = 0
-            seats_by_cat["SM"] = seats_by_cat.get("SM", 0) + oe_seats
-
-        # SD -> XS
-        if seats_by_cat.get("SD", 0) > 0:
-            sd_seats = seats_by_cat["SD"]
-            source_key = f"{group_prefix}-SD"
-            orig_cat_value = orig_map.get(source_key, "SD")
-            results.append({
-                "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                "OriginalCategory": orig_cat_value,
-                "Category": "XS", "Seats": sd_seats,
-                "ConvertedFrom": "SD", "ConversionFlag": "Y", "ConversionReason": "SD_to_XS"
-            })
-            targ_key = f"{group_prefix}-XS"
-            if targ_key not in orig_map:
-                orig_map[targ_key] = orig_cat_value
-            handled.add("SD")
-            seats_by_cat["SD"] = 0
-            seats_by_cat["XS"] = seats_by_cat.get("XS", 0) + sd_seats
-
-        # HR -> SD -> XS
-        if seats_by_cat.get("HR", 0) > 0:
-            hr_seats = seats_by_cat["HR"]
-            source_key = f"{group_prefix}-HR"
-            orig_cat_value = orig_map.get(source_key, "HR")
-            results.append({
-                "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                "OriginalCategory": orig_cat_value,
-                "Category": "XS", "Seats": hr_seats,
-                "ConvertedFrom": "HR", "ConversionFlag": "Y", "ConversionReason": "HR_to_SD_to_XS"
-            })
-            targ_key = f"{group_prefix}-XS"
-            if targ_key not in orig_map:
-                orig_map[targ_key] = orig_cat_value
-            handled.add("HR")
-            seats_by_cat["HR"] = 0
-            seats_by_cat["XS"] = seats_by_cat.get("XS", 0) + hr_seats
-
-        # Direct -> MP
-        for cat in direct_to_mp:
-            seats = seats_by_cat.get(cat, 0)
-            if seats > 0:
-                source_key = f"{group_prefix}-{cat}"
-                src_orig = orig_map.get(source_key, cat)
-                for r in distribute_to_mp(seats, cat, config):
-                    results.append({
-                        "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                        "OriginalCategory": src_orig,
-                        "Category": r["Category"], "Seats": r["Seats"],
-                        "ConvertedFrom": cat, "ConversionFlag": "Y", "ConversionReason": "DirectToMP"
-                    })
-                    targ_key = f"{group_prefix}-{r['Category']}"
-                    if targ_key not in orig_map:
-                        orig_map[targ_key] = src_orig
-                handled.add(cat)
-                seats_by_cat[cat] = 0
-
-        # Ladder conversions
-        for src_cat in orig_cats:
-            if src_cat in handled:
-                continue
-            src_seats = seats_by_cat.get(src_cat, 0)
-            if src_seats <= 0:
-                continue
-
-            if src_cat in ladders:
-                chosen = src_cat
-                for nxt in ladders[src_cat]:
-                    if forward_map.get(nxt) == src_cat:
-                        continue
-                    if src_cat == "SC" and nxt == "ST" and seats_by_cat.get("ST", 0) > 0:
-                        continue
-                    if src_cat == "ST" and nxt == "SC" and seats_by_cat.get("SC", 0) > 0:
-                        continue
-                    if seats_by_cat.get(nxt, 0) == 0:
-                        chosen = nxt
-                        break
-
-                if chosen != src_cat:
-                    forward_map[src_cat] = chosen
-                    source_key = f"{group_prefix}-{src_cat}"
-                    src_orig = orig_map.get(source_key, src_cat)
-                    results.append({
-                        "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                        "OriginalCategory": src_orig,
-                        "Category": chosen, "Seats": src_seats,
-                        "ConvertedFrom": src_cat, "ConversionFlag": "Y",
-                        "ConversionReason": f"{src_cat}_to_{chosen}"
-                    })
-                    targ_key = f"{group_prefix}-{chosen}"
-                    if targ_key not in orig_map:
-                        orig_map[targ_key] = src_orig
-                    seats_by_cat[chosen] = seats_by_cat.get(chosen, 0) + src_seats
-                    seats_by_cat[src_cat] = 0
-                    handled.add(src_cat)
-                    converted_targets.add(chosen)
-
-        # Direct -> SM
-        for cat in direct_to_sm:
-            if cat in handled:
-                continue
-            seats = seats_by_cat.get(cat, 0)
-            if seats > 0:
-                source_key = f"{group_prefix}-{cat}"
-                src_orig = orig_map.get(source_key, cat)
+    # Direct -> MP
+    for cat in direct_to_mp:
+        seats = seats_by_cat.get(cat, 0)
+        if seats > 0:
+            source_key = f"{group_prefix}-{cat}"
+            src_orig = orig_map.get(source_key, cat)
+            for r in distribute_to_mp(seats, cat, plan):
                 results.append({
                     "Stream": stream, "InstType": inst, "Course": course, "College": college,
                     "OriginalCategory": src_orig,
-                    "Category": "SM", "Seats": seats,
-                    "ConvertedFrom": cat, "ConversionFlag": "Y", "ConversionReason": "DirectToSM"
+                    "Category": r["Category"], "Seats": r["Seats"],
+                    "ConvertedFrom": cat, "ConversionFlag": "Y", "ConversionReason": "DirectToMP"
                 })
-                targ_key = f"{group_prefix}-SM"
+                targ_key = f"{group_prefix}-{r['Category']}"
                 if targ_key not in orig_map:
                     orig_map[targ_key] = src_orig
-                handled.add(cat)
-                seats_by_cat[cat] = 0
-
-        # Swap pairs
-        for a, b in swap_pairs:
-            a_seats = seats_by_cat.get(a, 0)
-            b_seats = seats_by_cat.get(b, 0)
-            if a_seats > 0 and b_seats > 0:
-                source_key = f"{group_prefix}-{a}"
-                src_orig = orig_map.get(source_key, a)
+            handled.add(cat)
+            seats_by_cat[cat] = 0
+
+    # Ladder conversions
+    for src_cat in orig_cats:
+        if src_cat in handled:
+            continue
+        src_seats = seats_by_cat.get(src_cat, 0)
+        if src_seats <= 0:
+            continue
+
+        if src_cat in plan.transitions:
+            chosen = src_cat
+            for nxt, guarded in plan.transitions[src_cat]:
+                if guarded and forward_map.get(nxt) == src_cat:
+                    continue
+                if seats_by_cat.get(nxt, 0) == 0:
+                    chosen = nxt
+                    break
+
+            if chosen != src_cat:
+                forward_map[src_cat] = chosen
+                source_key = f"{group_prefix}-{src_cat}"
+                src_orig = orig_map.get(source_key, src_cat)
                 results.append({
                     "Stream": stream, "InstType": inst, "Course": course, "College": college,
                     "OriginalCategory": src_orig,
-                    "Category": b, "Seats": a_seats,
-                    "ConvertedFrom": a, "ConversionFlag": "Y", "ConversionReason": f"{a}_to_{b}"
+                    "Category": chosen, "Seats": src_seats,
+                    "ConvertedFrom": src_cat, "ConversionFlag": "Y",
+                    "ConversionReason": f"{src_cat}_to_{chosen}"
                 })
-                targ_key = f"{group_prefix}-{b}"
+                targ_key = f"{group_prefix}-{chosen}"
                 if targ_key not in orig_map:
                     orig_map[targ_key] = src_orig
-                handled.add(a)
-                seats_by_cat[a] = 0
+                seats_by_cat[chosen] = seats_by_cat.get(chosen, 0) + src_seats
+                seats_by_cat[src_cat] = 0
+                handled.add(src_cat)
+                converted_targets.add(chosen)
 
-        # Remaining categories
-        for cat in orig_cats:
-            if cat in handled or cat in converted_targets:
-                continue
-            key = f"{group_prefix}-{cat}"
-            orig_value = orig_map.get(key, cat)
+    # Direct -> SM
+    for cat in direct_to_sm:
+        if cat in handled:
+            continue
+        seats = seats_by_cat.get(cat, 0)
+        if seats > 0:
+            source_key = f"{group_prefix}-{cat}"
+            src_orig = orig_map.get(source_key, cat)
+            results.append({
+                "Stream": stream, "InstType": inst, "Course": course, "College": college,
+                "OriginalCategory": src_orig,
+                "Category": "SM", "Seats": seats,
+                "ConvertedFrom": cat, "ConversionFlag": "Y", "ConversionReason": "DirectToSM"
+            })
+            targ_key = f"{group_prefix}-SM"
+            if targ_key not in orig_map:
+                orig_map[targ_key] = src_orig
+            handled.add(cat)
+            seats_by_cat[cat] = 0
+
+    # Swap pairs
+    for a, b in swap_pairs:
+        a_seats = seats_by_cat.get(a, 0)
+        b_seats = seats_by_cat.get(b, 0)
+        if a_seats > 0 and b_seats > 0:
+            source_key = f"{group_prefix}-{a}"
+            src_orig = orig_map.get(source_key, a)
             results.append({
                 "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                "OriginalCategory": orig_value,
-                "Category": cat,
-                "Seats": seats_by_cat.get(cat, 0),
-                "ConvertedFrom": "", "ConversionFlag": "N",
-                "ConversionReason": "NoConversion" if cat in no_conversion else "NoRule_keep"
+                "OriginalCategory": src_orig,
+                "Category": b, "Seats": a_seats,
+                "ConvertedFrom": a, "ConversionFlag": "Y", "ConversionReason": f"{a}_to_{b}"
             })
+            targ_key = f"{group_prefix}-{b}"
+            if targ_key not in orig_map:
+                orig_map[targ_key] = src_orig
+            handled.add(a)
+            seats_by_cat[a] = 0
+
+    # Remaining categories
+    for cat in orig_cats:
+        if cat in handled or cat in converted_targets:
+            continue
+        key = f"{group_prefix}-{cat}"
+        orig_value = orig_map.get(key, cat)
+        results.append({
+            "Stream": stream, "InstType": inst, "Course": course, "College": college,
+            "OriginalCategory": orig_value,
+            "Category": cat,
+            "Seats": seats_by_cat.get(cat, 0),
+            "ConvertedFrom": "", "ConversionFlag": "N",
+            "ConversionReason": "NoConversion" if cat in no_conversion else "NoRule_keep"
+        })
+
+
+def convert_seats(df, config, forward_map=None, orig_map=None, engine="loop"):
+    if engine == "matrix":
+        return convert_seats_matrix(df, config, forward_map, orig_map)
+    df = df.copy()
+    df["Category"] = df["Category"].astype(str).str.strip().str.upper()
+    df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
+
+    plan = compile_rules(config)
+    if forward_map is None:
+        forward_map = {}
+    if orig_map is None:
+        orig_map = {}
+
+    results = []
+    group_keys = ["Stream", "InstType", "Course", "College"]
+    grouped = df.groupby(group_keys, sort=False)
+
+    for group_vals, group in grouped:
+        seats_by_cat = group.groupby("Category", sort=False)["Seats"].sum().to_dict()
+        orig_cats = list(group["Category"].unique())
+        _convert_group(group_vals, seats_by_cat, orig_cats, plan, forward_map, orig_map, results)
 
     out_df = pd.DataFrame(results)
     columns_order = ["Stream", "InstType", "Course", "College",
@@ -312,7 +580,723 @@ def convert_seats(df, config, forward_map=None, orig_map=None):
                      "ConvertedFrom", "ConversionFlag", "ConversionReason"]
     out_df = out_df[[c for c in columns_order if c in out_df.columns]]
     return out_df, forward_map, orig_map
-def process_excel(file, config, round_num, forward_map=None, orig_map=None):
+
+# ---------------------------
+# Matrix Conversion Engine
+# ---------------------------
+def convert_seats_matrix(df, config, forward_map=None, orig_map=None, trace=None):
+    """
+    Same contract and output as convert_seats, computed on a group x category seat
+    matrix: OE/SD/HR, direct-to-MP, direct-to-SM, swap and keep rules run as array
+    operations over all groups at once. Ladders depend on forward_map, which earlier
+    groups update, so they are resolved by one scan over the candidate cells only.
+
+    trace, if a dict, receives the output row count of each group ("rows") and, per
+    group that ran a ladder, its forward_map reads and writes in order and its input
+    categories and seats ("ladder"); convert_seats_partitioned merges shards with it.
+    """
+    df = df.copy()
+    df["Category"] = df["Category"].astype(str).str.strip().str.upper()
+    df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
+
+    plan = compile_rules(config)
+    direct_to_mp, direct_to_sm = plan.direct_to_mp, plan.direct_to_sm
+    swap_pairs, no_conversion = plan.swap_pairs, plan.no_conversion
+
+    if forward_map is None:
+        forward_map = {}
+    if orig_map is None:
+        orig_map = {}
+
+    group_keys = ["Stream", "InstType", "Course", "College"]
+    gid = df.groupby(group_keys, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    rows = df[gid >= 0]
+    gid = gid[gid >= 0]
+    if rows["Category"].isna().any():
+        return convert_seats(df, config, forward_map, orig_map)
+
+    groups = rows[group_keys].drop_duplicates()
+    group_vals = [tuple(v) for v in groups.itertuples(index=False, name=None)]
+    prefixes = [f"{s}-{i}-{c}-{col}" for s, i, c, col in group_vals]
+    if len(set(prefixes)) != len(prefixes):
+        # Distinct groups sharing an orig_map prefix interact; keep the sequential engine
+        return convert_seats(df, config, forward_map, orig_map)
+
+    mp_frac = plan.mp_frac
+    mp_cats = list(mp_frac.keys())
+    # Rule categories keep their interned plan IDs; data-only categories follow
+    cats = list(dict.fromkeys(plan.categories + tuple(pd.unique(rows["Category"]))))
+    cid_of = dict(plan.cat_id)
+    cid_of.update((c, i) for i, c in enumerate(cats[len(plan.categories):], start=len(plan.categories)))
+    n_groups, n_cats = len(group_vals), len(cats)
+    cid = rows["Category"].map(cid_of).to_numpy()
+
+    seats = np.zeros((n_groups, n_cats), dtype=np.int64)
+    np.add.at(seats, (gid, cid), rows["Seats"].to_numpy(dtype=np.int64))
+    pairs = pd.DataFrame({"g": gid, "c": cid}).drop_duplicates()
+    present = np.zeros((n_groups, n_cats), dtype=bool)
+    present[pairs["g"], pairs["c"]] = True
+    # Position of each category in its group's first-appearance order (orig_cats)
+    appear = np.full((n_groups, n_cats), n_cats, dtype=np.int64)
+    appear[pairs["g"], pairs["c"]] = pairs.groupby("g").cumcount().to_numpy()
+
+    missing = object()
+    if isinstance(orig_map, LineageStore):
+        orig = orig_map.lookup(prefixes, cats, default=missing)
+    else:
+        orig = np.empty((n_groups, n_cats), dtype=object)
+        for g, prefix in enumerate(prefixes):
+            orig[g] = [orig_map.get(f"{prefix}-{c}", missing) for c in cats]
+    known = orig != missing
+    cat_names = np.array(cats, dtype=object)
+    orig[present & ~known] = np.broadcast_to(cat_names, orig.shape)[present & ~known]
+
+    seats0 = seats.copy() if trace is not None else None
+    handled = np.zeros((n_groups, n_cats), dtype=bool)
+    targets = np.zeros((n_groups, n_cats), dtype=bool)
+    out = {k: [] for k in ("g", "step", "sub1", "sub2", "orig", "cat", "seats", "from", "flag", "reason")}
+
+    def source_orig(g, c):
+        o = orig[g, c]
+        return np.where(o == missing, cat_names[c], o) if np.ndim(o) else (cats[c] if o is missing else o)
+
+    def set_target(g, t, values):
+        unset = orig[g, t] == missing
+        orig[g[unset], t] = values[unset]
+
+    def emit(g, step, sub1, sub2, src_orig, cat, n, conv_from, flag, reason):
+        count = len(g)
+        out["g"].append(g)
+        out["step"].append(np.full(count, step))
+        out["sub1"].append(np.broadcast_to(sub1, count))
+        out["sub2"].append(np.broadcast_to(sub2, count))
+        out["orig"].append(np.asarray(src_orig, dtype=object))
+        out["cat"].append(np.broadcast_to(np.asarray(cat, dtype=object), count))
+        out["seats"].append(np.asarray(n, dtype=np.int64))
+        out["from"].append(np.broadcast_to(np.asarray(conv_from, dtype=object), count))
+        out["flag"].append(np.full(count, flag, dtype=object))
+        out["reason"].append(np.broadcast_to(np.asarray(reason, dtype=object), count))
+
+    # OE -> SM, SD -> XS, HR -> SD -> XS
+    for step, (src, dst, reason) in enumerate(FIXED_CONVERSIONS, start=1):
+        s, d = cid_of[src], cid_of[dst]
+        g = np.flatnonzero(seats[:, s] > 0)
+        src_orig = source_orig(g, s)
+        emit(g, step, 0, 0, src_orig, dst, seats[g, s], src, "Y", reason)
+        set_target(g, d, src_orig)
+        handled[g, s] = True
+        seats[g, d] += seats[g, s]
+        seats[g, s] = 0
+
+    # Direct -> MP
+    fracs = np.array(list(mp_frac.values()), dtype=float)
+    for pos, cat in enumerate(direct_to_mp):
+        c = cid_of[cat]
+        g = np.flatnonzero(seats[:, c] > 0)
+        if len(g):
+            src_orig = source_orig(g, c)
+            alloc, _ = apportion_seats(seats[g, c], fracs)
+            for k, mp_cat in enumerate(mp_cats):
+                sel = alloc[:, k] > 0
+                emit(g[sel], 4, pos, k, src_orig[sel], mp_cat, alloc[sel, k], cat, "Y", "DirectToMP")
+                set_target(g[sel], cid_of[mp_cat], src_orig[sel])
+        handled[g, c] = True
+        seats[g, c] = 0
+
+    # Ladder conversions: a sequential scan, since each choice reads forward_map
+    ladder_ids = {cid_of[k]: [(cid_of[t], guarded) for t, guarded in v] for k, v in plan.transitions.items()}
+    cand_g, cand_c = np.nonzero(present & ~handled & np.isin(np.arange(n_cats), list(ladder_ids))[None, :])
+    order = np.lexsort((appear[cand_g, cand_c], cand_g))
+    lad = {k: [] for k in ("g", "c", "t", "n", "o")}
+    if trace is not None:
+        trace["ladder"] = {}
+
+        def group_inputs(g):
+            own = np.flatnonzero(present[g])
+            own = own[np.argsort(appear[g, own], kind="stable")]
+            return [cats[c] for c in own], {cats[c]: int(seats0[g, c]) for c in own}
+    for g, c in zip(cand_g[order].tolist(), cand_c[order].tolist()):
+        n = int(seats[g, c])
+        if n <= 0:
+            continue
+        if trace is not None and g not in trace["ladder"]:
+            trace["ladder"][g] = ([], group_inputs(g))
+        src = cats[c]
+        chosen = c
+        for t, guarded in ladder_ids[c]:
+            if guarded:
+                blocked = forward_map.get(cats[t]) == src
+                if trace is not None:
+                    trace["ladder"][g][0].append((cats[t], src, blocked))
+                if blocked:
+                    continue
+            if seats[g, t] == 0:
+                chosen = t
+                break
+        if chosen != c:
+            forward_map[src] = cats[chosen]
+            if trace is not None:
+                trace["ladder"][g][0].append((src, cats[chosen]))
+            src_orig = source_orig(g, c)
+            lad["g"].append(g); lad["c"].append(c); lad["t"].append(chosen); lad["n"].append(n); lad["o"].append(src_orig)
+            if orig[g, chosen] is missing:
+                orig[g, chosen] = src_orig
+            seats[g, chosen] += n
+            seats[g, c] = 0
+            handled[g, c] = True
+            targets[g, chosen] = True
+    if lad["g"]:
+        g = np.array(lad["g"])
+        src_names = cat_names[lad["c"]]
+        dst_names = cat_names[lad["t"]]
+        emit(g, 5, np.arange(len(g)), 0, np.array(lad["o"], dtype=object), dst_names, lad["n"], src_names, "Y",
+             np.array([f"{a}_to_{b}" for a, b in zip(src_names, dst_names)], dtype=object))
+
+    # Direct -> SM
+    sm = cid_of["SM"]
+    for pos, cat in enumerate(direct_to_sm):
+        c = cid_of[cat]
+        g = np.flatnonzero(~handled[:, c] & (seats[:, c] > 0))
+        src_orig = source_orig(g, c)
+        emit(g, 6, pos, 0, src_orig, "SM", seats[g, c], cat, "Y", "DirectToSM")
+        set_target(g, sm, src_orig)
+        handled[g, c] = True
+        seats[g, c] = 0
+
+    # Swap pairs
+    for pos, (a, b) in enumerate(swap_pairs):
+        ca, cb = cid_of[a], cid_of[b]
+        g = np.flatnonzero((seats[:, ca] > 0) & (seats[:, cb] > 0))
+        src_orig = source_orig(g, ca)
+        emit(g, 7, pos, 0, src_orig, b, seats[g, ca], a, "Y", f"{a}_to_{b}")
+        set_target(g, cb, src_orig)
+        handled[g, ca] = True
+        seats[g, ca] = 0
+
+    # Remaining categories
+    g, c = np.nonzero(present & ~handled & ~targets)
+    keep_reason = np.where(np.isin(cat_names[c], list(no_conversion)), "NoConversion", "NoRule_keep")
+    emit(g, 8, appear[g, c], 0, source_orig(g, c), cat_names[c], seats[g, c], "", "N", keep_reason.astype(object))
+
+    columns_order = ["Stream", "InstType", "Course", "College",
+                     "OriginalCategory", "Category", "Seats",
+                     "ConvertedFrom", "ConversionFlag", "ConversionReason"]
+    cols = {k: np.concatenate(v) if v else np.array([]) for k, v in out.items()}
+    if not len(cols["g"]):
+        out_df = pd.DataFrame()
+    else:
+        order = np.lexsort((cols["sub2"], cols["sub1"], cols["step"], cols["g"]))
+        g = cols["g"][order].astype(np.int64)
+        vals = np.empty((len(group_vals), 4), dtype=object)
+        vals[:] = group_vals
+        out_df = pd.DataFrame({
+            "Stream": vals[g, 0], "InstType": vals[g, 1], "Course": vals[g, 2], "College": vals[g, 3],
+            "OriginalCategory": cols["orig"][order], "Category": cols["cat"][order],
+            "Seats": cols["seats"][order],
+            "ConvertedFrom": cols["from"][order], "ConversionFlag": cols["flag"][order],
+            "ConversionReason": cols["reason"][order],
+        })
+    if trace is not None:
+        trace["rows"] = np.bincount(cols["g"].astype(np.int64), minlength=n_groups)
+
+    for g, c in zip(*np.nonzero(~known & (orig != missing))):
+        orig_map[f"{prefixes[g]}-{cats[c]}"] = orig[g, c]
+    out_df = out_df[[c for c in columns_order if c in out_df.columns]]
+    return out_df, forward_map, orig_map
+
+
+# ---------------------------
+# Partitioned Conversion
+# ---------------------------
+PARTITION_KEYS = ["Stream", "Course"]
+# Shard workers are started fresh rather than forked: forking a multithreaded
+# process (the Streamlit server) can deadlock the child on a lock held by another thread
+PARTITION_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _convert_shard(args):
+    """Process-pool task: matrix conversion of one shard from the round's starting forward_map."""
+    df, plan, forward_map, orig_map = args
+    known = set(orig_map)
+    trace = {}
+    out, _, orig_map = convert_seats_matrix(df, plan, dict(forward_map), orig_map, trace)
+    return out, trace, [(k, v) for k, v in orig_map.items() if k not in known]
+
+
+def _replay_ladder(events, forward_map):
+    """
+    forward_map writes of a traced ladder if each recorded read still holds against
+    forward_map (reads are (key, source, blocked), writes (source, target)), else None.
+    """
+    writes = {}
+    for event in events:
+        if len(event) == 3:
+            key, src, blocked = event
+            if ((writes[key] if key in writes else forward_map.get(key)) == src) != blocked:
+                return None
+        else:
+            writes[event[0]] = event[1]
+    return writes
+
+
+def _shard_rows(df, workers):
+    """Row positions of each shard: whole Stream/Course partitions, largest first onto the lightest shard."""
+    part = df.groupby(PARTITION_KEYS, sort=False, dropna=False).ngroup().to_numpy()
+    sizes = np.bincount(part)
+    load = np.zeros(workers, dtype=np.int64)
+    owner = np.empty(len(sizes), dtype=np.int64)
+    for p in np.argsort(-sizes, kind="stable"):
+        w = int(np.argmin(load))
+        owner[p] = w
+        load[w] += sizes[p]
+    shard = owner[part]
+    return [rows for rows in (np.flatnonzero(shard == w) for w in range(workers)) if len(rows)]
+
+
+def _convert_serial(df, plan, forward_map, orig_map, start, stats):
+    out, forward_map, orig_map = convert_seats_matrix(df, plan, forward_map, orig_map)
+    if stats is not None:
+        groups = df.groupby(["Stream", "InstType", "Course", "College"], sort=False).ngroups
+        stats.update(workers=1, shards=1, groups=groups, recomputed=0, seconds=time.perf_counter() - start)
+    return out, forward_map, orig_map
+
+
+def _group_layout(df, plan):
+    """
+    (gid per row, group values, prefixes) for traced conversion, or None when the
+    groups cannot be converted independently (shared prefixes, NaN or "-" categories).
+    """
+    group_keys = ["Stream", "InstType", "Course", "College"]
+    gid = df.groupby(group_keys, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    group_vals = list(df.loc[gid >= 0, group_keys].drop_duplicates().itertuples(index=False, name=None))
+    prefixes = [f"{s}-{i}-{c}-{col}" for s, i, c, col in group_vals]
+    cats = df["Category"].astype(str).str.strip().str.upper()[gid >= 0]
+    if (len(set(prefixes)) != len(prefixes) or cats.isna().any()
+            or cats.str.contains("-").any() or any("-" in c for c in plan.categories)):
+        return None
+    return gid, group_vals, prefixes
+
+
+def _traced_sources(trace, new_orig, local_of):
+    """Per group of one traced run: (start, count, ladder events, new orig_map entries, inputs)."""
+    counts = trace["rows"]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    entries = [[] for _ in counts]
+    for k, v in new_orig:
+        entries[local_of[k.rsplit("-", 1)[0]]].append((k, v))
+    sources = []
+    for lg in range(len(counts)):
+        events, inputs = trace["ladder"].get(lg, ((), None))
+        sources.append((int(starts[lg]), int(counts[lg]), events, entries[lg], inputs))
+    return sources
+
+
+def _merge_traced(frames, sources, group_vals, plan, forward_map, orig_map):
+    """
+    Replays traced per-group results in serial order. sources[g] is (frame index,
+    start, count, ladder events, new orig_map entries, inputs). A group whose
+    ladder read forward_map differently than the serial run would have is
+    converted again from its recorded inputs. Returns (out, recomputed, spans),
+    spans[g] being the group's (start, count) in out, or None if recomputed.
+    """
+    offsets = np.cumsum([0] + [len(f) for f in frames])
+    take, redo, spans, recomputed, pos = [], [], [], 0, 0
+    for g, (f, start, count, events, new_orig, inputs) in enumerate(sources):
+        writes = _replay_ladder(events, forward_map)
+        if writes is None:
+            first = len(redo)
+            orig_cats, seats_by_cat = inputs
+            _convert_group(group_vals[g], seats_by_cat, orig_cats, plan, forward_map, orig_map, redo)
+            take.append(np.arange(offsets[-1] + first, offsets[-1] + len(redo)))
+            spans.append(None)
+            recomputed += 1
+        else:
+            forward_map.update(writes)
+            for k, v in new_orig:
+                orig_map[k] = v
+            take.append(np.arange(offsets[f] + start, offsets[f] + start + count))
+            spans.append((pos, count))
+        pos += len(take[-1])
+
+    columns_order = ["Stream", "InstType", "Course", "College",
+                     "OriginalCategory", "Category", "Seats",
+                     "ConvertedFrom", "ConversionFlag", "ConversionReason"]
+    frames = list(frames)
+    if redo:
+        frames.append(pd.DataFrame(redo)[columns_order])
+    frames = [f for f in frames if len(f)]
+    if frames:
+        out = pd.concat(frames, ignore_index=True).take(np.concatenate(take)).reset_index(drop=True)
+    else:
+        out = pd.DataFrame()
+    return out, recomputed, spans
+
+
+def convert_seats_partitioned(df, config, forward_map=None, orig_map=None, workers=None, stats=None):
+    """
+    convert_seats with the groups sharded across a process pool by Stream/Course.
+
+    Each shard runs the matrix engine from the round's starting forward_map; the
+    shards are then merged with _merge_traced, so output, forward_map and orig_map
+    match the serial run exactly.
+    stats, if a dict, receives workers, shards, groups, recomputed and seconds.
+    """
+    start = time.perf_counter()
+    plan = compile_rules(config)
+    workers = workers or os.cpu_count() or 1
+    if forward_map is None:
+        forward_map = {}
+    if orig_map is None:
+        orig_map = {}
+
+    layout = _group_layout(df, plan) if workers > 1 else None
+    shards = _shard_rows(df, workers) if layout and len(layout[1]) > 1 else []
+    if len(shards) < 2:
+        return _convert_serial(df, plan, forward_map, orig_map, start, stats)
+    gid, group_vals, prefixes = layout
+
+    # Lineage entries travel with the shard that owns their group prefix
+    gid_of = {p: g for g, p in enumerate(prefixes)}
+    owner = np.empty(len(prefixes), dtype=np.int64)
+    local = np.empty(len(prefixes), dtype=np.int64)
+    shard_gids = []
+    for w, rows in enumerate(shards):
+        g = pd.unique(gid[rows][gid[rows] >= 0])
+        owner[g] = w
+        local[g] = np.arange(len(g))
+        shard_gids.append(g)
+    shard_orig = [{} for _ in shards]
+    for k, v in orig_map.items():
+        g = gid_of.get(k.rsplit("-", 1)[0])
+        if g is not None:
+            shard_orig[owner[g]][k] = v
+
+    tasks = [(df.iloc[rows], plan, forward_map, shard_orig[w]) for w, rows in enumerate(shards)]
+    context = multiprocessing.get_context(PARTITION_START_METHOD)
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as pool:
+        results = list(pool.map(_convert_shard, tasks))
+
+    sources = [None] * len(prefixes)
+    for w, (out, trace, new_orig) in enumerate(results):
+        local_gid = {prefixes[g]: lg for lg, g in enumerate(shard_gids[w])}
+        for lg, src in enumerate(_traced_sources(trace, new_orig, local_gid)):
+            sources[shard_gids[w][lg]] = (w,) + src
+    out, recomputed, _ = _merge_traced([out for out, _, _ in results], sources, group_vals,
+                                       plan, forward_map, orig_map)
+    if stats is not None:
+        stats.update(workers=workers, shards=len(shards), groups=len(prefixes), recomputed=recomputed,
+                     seconds=time.perf_counter() - start)
+    return out, forward_map, orig_map
+
+
+def partition_speedup(df, config, worker_counts=(1, 2, 4), forward_map=None, orig_map=None):
+    """
+    Times convert_seats_partitioned per worker count against the serial matrix
+    engine on copies of the lineage, and checks each result is identical.
+    """
+    forward_map, orig_map = dict(forward_map or {}), dict(orig_map or {})
+    start = time.perf_counter()
+    expected = convert_seats_matrix(df, config, dict(forward_map), dict(orig_map))
+    serial = time.perf_counter() - start
+    report = [{"Workers": "serial", "Seconds": round(serial, 3), "Speedup": 1.0, "Recomputed": 0, "Identical": True}]
+    for n in worker_counts:
+        stats = {}
+        out = convert_seats_partitioned(df, config, dict(forward_map), dict(orig_map), workers=n, stats=stats)
+        report.append({
+            "Workers": n, "Seconds": round(stats["seconds"], 3),
+            "Speedup": round(serial / stats["seconds"], 2) if stats["seconds"] else None,
+            "Recomputed": stats["recomputed"],
+            "Identical": out[0].equals(expected[0]) and out[1:] == expected[1:],
+        })
+    return pd.DataFrame(report)
+
+
+# ---------------------------
+# Incremental Conversion
+# ---------------------------
+HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _group_input_hashes(df, gid, n_groups):
+    """Order-sensitive 64-bit hash and row count of each group's (Category, Seats) rows."""
+    keep = gid >= 0
+    g = gid[keep]
+    rows = pd.util.hash_pandas_object(df.loc[keep, ["Category", "Seats"]], index=False).to_numpy()
+    pos = pd.Series(g).groupby(g).cumcount().to_numpy().astype(np.uint64)
+    hashes = np.zeros(n_groups, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        np.add.at(hashes, g, rows * np.power(HASH_MULTIPLIER, pos + np.uint64(1)))
+    return hashes, np.bincount(g, minlength=n_groups)
+
+
+def convert_seats_incremental(df, config, forward_map=None, orig_map=None, cache=None, stats=None):
+    """
+    convert_seats that reuses the previous run's output for unchanged groups.
+
+    cache is a dict the caller keeps between runs (e.g. in st.session_state). It
+    holds the rule plan key, the last output and, per group, a key made of the
+    group's input hash and its orig_map entries before that run. Groups with the
+    same plan and key are reused, the rest go through the matrix engine, and both
+    are merged with _merge_traced, so the result matches a full run.
+    stats, if a dict, receives groups, reused, recomputed and seconds.
+    """
+    start = time.perf_counter()
+    plan = compile_rules(config)
+    if forward_map is None:
+        forward_map = {}
+    if orig_map is None:
+        orig_map = {}
+    if cache is None:
+        cache = {}
+    df = df.copy()
+    df["Category"] = df["Category"].astype(str).str.strip().str.upper()
+    df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
+
+    layout = _group_layout(df, plan)
+    if layout is None:
+        cache.clear()
+        out, forward_map, orig_map = convert_seats_matrix(df, plan, forward_map, orig_map)
+        if stats is not None:
+            groups = df.groupby(["Stream", "InstType", "Course", "College"], sort=False).ngroups
+            stats.update(groups=groups, reused=0, recomputed=groups, seconds=time.perf_counter() - start)
+        return out, forward_map, orig_map
+    gid, group_vals, prefixes = layout
+    if cache.get("plan") != plan.key:
+        cache.clear()
+    previous = cache.get("groups", {})
+
+    gid_of = {p: g for g, p in enumerate(prefixes)}
+    before = [[] for _ in prefixes]
+    for k, v in orig_map.items():
+        g = gid_of.get(k.rsplit("-", 1)[0])
+        if g is not None:
+            before[g].append((k, v))
+    hashes, counts = _group_input_hashes(df, gid, len(prefixes))
+    keys = [(int(h), int(n), tuple(sorted(e))) for h, n, e in zip(hashes.tolist(), counts.tolist(), before)]
+    reuse = [p in previous and previous[p][0] == k for p, k in zip(prefixes, keys)]
+
+    # Convert the changed groups in one traced matrix run
+    changed = np.flatnonzero(~np.array(reuse, dtype=bool))
+    sources = [(0,) + previous[p][1:] if hit else None for p, hit in zip(prefixes, reuse)]
+    frames = [cache.get("frame", pd.DataFrame())]
+    if len(changed):
+        trace = {}
+        changed_orig = {k: v for g in changed.tolist() for k, v in before[g]}
+        known = set(changed_orig)
+        fresh, _, changed_orig = convert_seats_matrix(df[np.isin(gid, changed)], plan, dict(forward_map),
+                                                      changed_orig, trace)
+        new_orig = [(k, v) for k, v in changed_orig.items() if k not in known]
+        local_of = {prefixes[g]: lg for lg, g in enumerate(changed.tolist())}
+        for g, src in zip(changed.tolist(), _traced_sources(trace, new_orig, local_of)):
+            sources[g] = (1,) + src
+        frames.append(fresh)
+
+    out, redone, spans = _merge_traced(frames, sources, group_vals, plan, forward_map, orig_map)
+    cache.clear()
+    cache.update(plan=plan.key, frame=out.copy(deep=False), groups={
+        p: (keys[g],) + spans[g] + sources[g][3:] for g, p in enumerate(prefixes) if spans[g] is not None
+    })
+    if stats is not None:
+        reused = sum(1 for hit, span in zip(reuse, spans) if hit and span is not None)
+        stats.update(groups=len(prefixes), reused=reused, recomputed=len(prefixes) - reused,
+                     seconds=time.perf_counter() - start)
+    return out, forward_map, orig_map
+
+
+# ---------------------------
+# What-if Scenarios
+# ---------------------------
+def scenario_config(base, **overrides):
+    """A copy of base with top-level keys (mp_distribution, ladders, ...) replaced."""
+    config = copy.deepcopy(base)
+    config.update(copy.deepcopy(overrides))
+    return config
+
+
+def _matrix_scenario_totals(df, plans, forward_map):
+    """
+    {name: category totals} of convert_seats_matrix for each {name: RulePlan}.
+
+    The group x category seat matrix and the OE/SD/HR conversions are built once;
+    direct-to-MP is apportioned once per distinct MP distribution for all scenarios
+    sharing it, and the ladder scan, which reads and writes forward_map, once per
+    distinct set of ladders and MP sources. Only the array steps after it run per
+    scenario.
+    """
+    group_keys = ["Stream", "InstType", "Course", "College"]
+    gid = df.groupby(group_keys, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    rows = df[gid >= 0]
+    gid = gid[gid >= 0]
+    cats = list(dict.fromkeys([c for plan in plans.values() for c in plan.categories]
+                              + list(pd.unique(rows["Category"]))))
+    cid_of = {c: i for i, c in enumerate(cats)}
+    n_groups, n_cats = (int(gid.max()) + 1 if len(gid) else 0), len(cats)
+    cid = rows["Category"].map(cid_of).to_numpy()
+
+    seats = np.zeros((n_groups, n_cats), dtype=np.int64)
+    np.add.at(seats, (gid, cid), rows["Seats"].to_numpy(dtype=np.int64))
+    pairs = pd.DataFrame({"g": gid, "c": cid}).drop_duplicates()
+    present = np.zeros((n_groups, n_cats), dtype=bool)
+    present[pairs["g"], pairs["c"]] = True
+    appear = np.full((n_groups, n_cats), n_cats, dtype=np.int64)
+    appear[pairs["g"], pairs["c"]] = pairs.groupby("g").cumcount().to_numpy()
+
+    # OE -> SM, SD -> XS, HR -> SD -> XS: the same in every scenario
+    base = np.zeros(n_cats, dtype=np.int64)
+    handled0 = np.zeros((n_groups, n_cats), dtype=bool)
+    for src, dst, _ in FIXED_CONVERSIONS:
+        s, d = cid_of[src], cid_of[dst]
+        g = np.flatnonzero(seats[:, s] > 0)
+        base[d] += seats[g, s].sum()
+        handled0[g, s] = True
+        seats[g, d] += seats[g, s]
+        seats[g, s] = 0
+
+    # Direct -> MP: MP seats never feed back into the matrix, so each source
+    # category's split depends only on the distribution; one batch per distribution
+    sources = {}
+    for plan in plans.values():
+        sources.setdefault(tuple(plan.mp_frac.items()), set()).update(cid_of[c] for c in plan.direct_to_mp)
+    mp_split = {}
+    for dist, cols in sources.items():
+        cols = np.array(sorted(cols), dtype=np.int64)
+        g, j = np.nonzero(seats[:, cols] > 0)
+        alloc, _ = apportion_seats(seats[g, cols[j]], [f for _, f in dist])
+        per_col = np.zeros((len(cols), len(dist)), dtype=np.int64)
+        np.add.at(per_col, j, alloc)
+        mp_split.update(((dist, c), per_col[pos]) for pos, c in enumerate(cols.tolist()))
+
+    # The ladder scan depends on the direct-to-MP sources (which cells are left),
+    # the ladders and forward_map only: scenarios sharing them share one scan
+    scans = {}
+    for name, plan in plans.items():
+        direct = tuple(dict.fromkeys(cid_of[cat] for cat in plan.direct_to_mp))
+        scans.setdefault((frozenset(direct), tuple(plan.transitions.items())), []).append((name, direct))
+
+    cat_names = np.array(cats, dtype=object)
+    results = {}
+    for members in scans.values():
+        scan_left = seats.copy()
+        scan_handled = handled0.copy()
+        direct = members[0][1]
+        for c in direct:
+            g = np.flatnonzero(scan_left[:, c] > 0)
+            scan_handled[g, c] = True
+            scan_left[g, c] = 0
+        moved, targets = _ladder_scan(scan_left, scan_handled, present, appear, cats, cid_of,
+                                      plans[members[0][0]], dict(forward_map))
+
+        for name, direct in members:
+            plan = plans[name]
+            total = base + moved
+            left = scan_left.copy()
+            handled = scan_handled.copy()
+            dist = tuple(plan.mp_frac.items())
+            mp_ids = [cid_of[c] for c in plan.mp_frac]
+            for c in direct:
+                total[mp_ids] += mp_split[dist, c]
+
+            sm = cid_of["SM"]
+            for cat in plan.direct_to_sm:
+                c = cid_of[cat]
+                g = np.flatnonzero(~handled[:, c] & (left[:, c] > 0))
+                total[sm] += left[g, c].sum()
+                handled[g, c] = True
+                left[g, c] = 0
+
+            for a, b in plan.swap_pairs:
+                ca, cb = cid_of[a], cid_of[b]
+                g = np.flatnonzero((left[:, ca] > 0) & (left[:, cb] > 0))
+                total[cb] += left[g, ca].sum()
+                handled[g, ca] = True
+                left[g, ca] = 0
+
+            kept = present & ~handled & ~targets
+            total += np.where(kept, left, 0).sum(axis=0)
+            # Categories the engine would emit rows for, zero-seat kept rows included
+            emitted = (total > 0) | kept.any(axis=0)
+            results[name] = pd.Series(total[emitted], index=cat_names[emitted])
+    return {name: results[name] for name in plans}
+
+
+def _ladder_scan(left, handled, present, appear, cats, cid_of, plan, forward_map):
+    """
+    convert_seats_matrix's ladder scan on a seat matrix, updating left, handled and
+    forward_map in place. Returns the seats moved into each category and the
+    cells that received them.
+    """
+    n_cats = len(cats)
+    moved = np.zeros(n_cats, dtype=np.int64)
+    targets = np.zeros(left.shape, dtype=bool)
+    ladder_ids = {cid_of[k]: [(cid_of[t], guarded) for t, guarded in v] for k, v in plan.transitions.items()}
+    cand_g, cand_c = np.nonzero(present & ~handled & np.isin(np.arange(n_cats), list(ladder_ids))[None, :])
+    if not len(cand_g):
+        return moved, targets
+    order = np.lexsort((appear[cand_g, cand_c], cand_g))
+    # The scan works on plain lists of the candidate groups' rows
+    scan_g, local = np.unique(cand_g, return_inverse=True)
+    rows_left = left[scan_g].tolist()
+    moves = {k: [] for k in ("g", "c", "t", "n")}
+    for g, c in zip(local[order].tolist(), cand_c[order].tolist()):
+        row = rows_left[g]
+        n = row[c]
+        if n <= 0:
+            continue
+        src = cats[c]
+        for t, guarded in ladder_ids[c]:
+            if guarded and forward_map.get(cats[t]) == src:
+                continue
+            if row[t] == 0:
+                forward_map[src] = cats[t]
+                row[t] += n
+                row[c] = 0
+                moves["g"].append(g); moves["c"].append(c); moves["t"].append(t); moves["n"].append(n)
+                break
+    if moves["g"]:
+        left[scan_g] = rows_left
+        g = scan_g[moves["g"]]
+        np.add.at(moved, moves["t"], moves["n"])
+        handled[g, moves["c"]] = True
+        targets[g, moves["t"]] = True
+    return moved, targets
+
+
+def simulate_scenarios(df, scenarios, forward_map=None, engine="matrix", ledger=None):
+    """
+    Category totals of one parsed seat matrix under each {name: config} scenario,
+    side by side with the input totals (rows: category, columns: Input + scenarios).
+
+    engine="matrix" gives the totals of convert_seats_matrix with every scenario
+    starting from its own copy of forward_map (see _matrix_scenario_totals).
+    engine="pooled" gives the totals of seat_conversion_ui's pooled engine (half-seat
+    guarantee, MP ledger carry if ledger is given; see scenario_totals there).
+    Lineage does not change totals, so no orig_map is carried.
+    """
+    df = df[["Stream", "InstType", "Course", "College", "Category", "Seats"]].copy()
+    df["Category"] = df["Category"].astype(str).str.strip().str.upper()
+    df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
+
+    plans = {}
+    for name, config in scenarios.items():
+        try:
+            plans[name] = compile_rules(config)
+        except ValueError as e:
+            raise ValueError(f"Scenario '{name}': {e}") from e
+
+    totals = {"Input": df.groupby("Category")["Seats"].sum()}
+    if engine == "pooled":
+        import seat_conversion_ui as pooled
+        totals.update(pooled.scenario_totals(df, scenarios, ledger))
+    else:
+        totals.update(_matrix_scenario_totals(df, plans, forward_map or {}))
+
+    result = pd.DataFrame(totals).fillna(0).astype(np.int64)
+    result.index.name = "Category"
+    return result.sort_values("Input", ascending=False, kind="stable")
+
+
+def read_seat_matrix(file):
+    """Seat codes (first column) and seats (second column) of an input Excel, parsed."""
     df = pd.read_excel(file, engine="openpyxl")
     if df.shape[1] < 2:
         raise ValueError("Input Excel must have at least 2 columns")
@@ -321,16 +1305,34 @@ def process_excel(file, config, round_num, forward_map=None, orig_map=None):
     seats_col = df.columns[1]
     df_codes = df[[code_col, seats_col]].copy()
     df_codes.columns = ["Code", "Seats"]
-    parsed = df_codes["Code"].apply(parse_code).apply(pd.Series)
+    parsed = parse_codes(df_codes["Code"])
     df_full = pd.concat([parsed, df_codes["Seats"].astype(int)], axis=1)
-    initial = df_full[["Stream", "InstType", "Course", "College", "Category", "Seats"]].copy()
+    return df_full[["Stream", "InstType", "Course", "College", "Category", "Seats"]].copy()
+
+
+def process_excel(file, config, round_num, forward_map=None, orig_map=None, engine="loop", workers=None,
+                  cache=None, stats=None):
+    initial = read_seat_matrix(file)
 
-    converted, forward_map, orig_map = convert_seats(initial, config, forward_map, orig_map)
+    if cache is not None:
+        converted, forward_map, orig_map = convert_seats_incremental(initial, config, forward_map, orig_map,
+                                                                     cache, stats)
+    elif workers and workers > 1:
+        converted, forward_map, orig_map = convert_seats_partitioned(initial, config, forward_map, orig_map,
+                                                                     workers, stats)
+    else:
+        converted, forward_map, orig_map = convert_seats(initial, config, forward_map, orig_map, engine=engine)
     converted["Round"] = round_num
     return converted, forward_map, orig_map
 def flush_session():
     """Clear session data (for Streamlit session reset)."""
     import streamlit as st
     st.session_state.forward_map = {}
-    st.session_state.orig_map = {}
+    if isinstance(st.session_state.get("orig_map"), LineageStore):
+        st.session_state.orig_map.clear()
+    else:
+        st.session_state.orig_map = LineageStore()
     st.session_state.last_round = 0
+    st.session_state.pop("conversion_cache", None)
+    if "history" in st.session_state:
+        st.session_state.history.clear()
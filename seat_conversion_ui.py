@@ -1,27 +1,38 @@
 # seat_conversion_streamlit.py
 import os
+import copy
 import json
-import math
 import io
+import hashlib
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from common_functions import write_xlsx_streaming
+# save_config is shared so a save also evicts the cached config in read_config_file
+from seat_conversion_logic import (apportion_seats, compile_rules, config_hash, read_config_file, save_config,
+                                   scenario_config, simulate_scenarios)
+from seat_lineage import LINEAGE_DIR, LineageStore
+
 # ---------------------------
 # Config / Session Files
 # ---------------------------
 CONFIG_FILE = "config.json"
 SESSION_FILE = "session_state.json"
 
+# Summary rows kept in each round manifest for the previous-rounds preview
+MANIFEST_PREVIEW_ROWS = 5
+
 # ---------------------------
 # Config management
 # ---------------------------
 def load_config():
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return read_config_file(CONFIG_FILE)
         except Exception:
             pass
     # default config
@@ -46,29 +57,41 @@ def load_config():
         }
     }
 
-def save_config(cfg):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(cfg, f, indent=2)
-
 # ---------------------------
 # Session management
 # ---------------------------
 def load_session():
+    """
+    Session metadata from session_state.json; orig_map is a LineageStore over
+    LINEAGE_DIR, read lazily. A legacy orig_map inside the JSON is migrated once.
+    """
+    data = {"forward_map": {}, "last_round": 0}
     if os.path.exists(SESSION_FILE):
         try:
             with open(SESSION_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 if "forward_map" not in data:
                     data["forward_map"] = {}
-                if "orig_map" not in data:
-                    data["orig_map"] = {}
-                return data
         except Exception:
             pass
-    return {"forward_map": {}, "orig_map": {}, "last_round": 0}
+    legacy = data.pop("orig_map", None)
+    data["orig_map"] = LineageStore(LINEAGE_DIR)
+    if legacy:
+        data["orig_map"].update(legacy)
+        save_session(data)
+    return data
 
 
 def save_session(data):
+    """Writes the small session JSON and appends new lineage entries as one segment."""
+    data = dict(data)
+    lineage = data.pop("orig_map", None)
+    if lineage is not None and not isinstance(lineage, LineageStore):
+        store = LineageStore(LINEAGE_DIR)
+        store.update(lineage)
+        lineage = store
+    if lineage is not None:
+        lineage.save()
     with open(SESSION_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2)
 
@@ -76,16 +99,12 @@ def save_session(data):
 def flush_session():
     if os.path.exists(SESSION_FILE):
         os.remove(SESSION_FILE)
+    LineageStore(LINEAGE_DIR).clear()
 
 # ---------------------------
 # Seat Conversion Logic
 # ---------------------------
-import math
-
-def distribute_to_mp(total_seats, config, carry_forward=None):
-    if carry_forward is None:
-        carry_forward = {}
-
+def _pool_fractions(config):
     DEFAULT_MP = {
         "SM": 0.50, "EWS": 0.10, "EZ": 0.09, "MU": 0.08,
         "BH": 0.03, "LA": 0.03, "DV": 0.02, "VK": 0.02,
@@ -98,60 +117,93 @@ def distribute_to_mp(total_seats, config, carry_forward=None):
 
     # normalize
     total_frac = sum(mp_rules.values())
-    mp_frac = {k: (v / total_frac) for k, v in mp_rules.items()}
+    return {k: (v / total_frac) for k, v in mp_rules.items()}
 
-    # expected seats (float)
-    effective = {cat: mp_frac[cat] * total_seats + float(carry_forward.get(cat, 0.0))
-                 for cat in mp_frac.keys()}
 
-    # floor allocation
-    alloc = {cat: int(math.floor(effective[cat])) for cat in effective.keys()}
-
-    # compute remainders
-    remainders = sorted(
-        [(cat, effective[cat] - alloc[cat]) for cat in effective.keys()],
-        key=lambda x: (-x[1], x[0])
+def _apportion_pools(totals, mp_frac, carry=None):
+    """
+    MP allocation for many pool totals at once: largest remainder with carry,
+    ties by category name, categories expecting >= 0.5 seats get at least one.
+    """
+    cats = list(mp_frac.keys())
+    return apportion_seats(
+        totals, [mp_frac[cat] for cat in cats], carry=carry,
+        tie_order=sorted(range(len(cats)), key=cats.__getitem__),
+        protect_half=True,
     )
 
-    # assign remaining seats by largest remainder
-    assigned = sum(alloc.values())
-    remaining = total_seats - assigned
-    for i in range(remaining):
-        alloc[remainders[i % len(remainders)][0]] += 1
-
-    # protect categories with expected >= 0.5 (ensure at least 1 seat)
-    protected = set()
-    for cat, val in effective.items():
-        if val >= 0.5 and alloc.get(cat, 0) == 0:
-            alloc[cat] = 1
-            protected.add(cat)
-
-    # if totals overshoot because of protection, remove from non-protected smallest remainders
-    while sum(alloc.values()) > total_seats:
-        removed = False
-        for cat, _ in reversed(remainders):
-            if cat in protected:
-                continue
-            if alloc[cat] > 0:
-                alloc[cat] -= 1
-                removed = True
-                break
-        if not removed:
-            # fallback: decrement any category >1
-            for cat in reversed(sorted(alloc.keys())):
-                if alloc[cat] > 1 and cat not in protected:
-                    alloc[cat] -= 1
-                    removed = True
-                    break
-            if not removed:
-                break
-
-    # final safeguard: if under-assigned, add to largest remainder (including protected)
-    while sum(alloc.values()) < total_seats:
-        for cat, _ in remainders:
-            alloc[cat] += 1
-            if sum(alloc.values()) >= total_seats:
-                break
+
+# ---------------------------
+# Apportionment Ledger
+# ---------------------------
+# ledger = {"carry": {"Stream-InstType-Course": {cat: remainder}},
+#           "expected": {cat: seats owed by share}, "allocated": {cat: seats given}}
+# Kept in the session JSON; each pool's carry is read and replaced once per round.
+
+def _pool_ledger_key(key):
+    return "-".join(str(v) for v in key)
+
+
+def _ledger_carry(ledger, keys, cats):
+    """(pools, categories) remainders carried in from earlier rounds."""
+    carry = ledger.get("carry", {})
+    return np.array([[carry.get(key, {}).get(cat, 0.0) for cat in cats] for key in keys], dtype=float)
+
+
+def _ledger_update(ledger, keys, cats, alloc, share, carry):
+    """Replaces each pool's carry with share + carry - alloc and adds to the per-category totals."""
+    remainders = np.round(share + carry - alloc, 6).tolist()
+    pool_carry = ledger.setdefault("carry", {})
+    for key, rem in zip(keys, remainders):
+        pool_carry[key] = dict(zip(cats, rem))
+    expected = ledger.setdefault("expected", {})
+    allocated = ledger.setdefault("allocated", {})
+    for cat, e, a in zip(cats, share.sum(axis=0).tolist(), np.asarray(alloc).sum(axis=0).tolist()):
+        expected[cat] = round(expected.get(cat, 0.0) + e, 6)
+        allocated[cat] = allocated.get(cat, 0) + int(a)
+
+
+def _trim_to_totals(alloc, effective, totals):
+    """
+    Carried remainders can lift more categories over the half-seat guarantee than
+    a small pool has seats; take the excess back from the most over-served ones.
+    """
+    for i in np.flatnonzero(alloc.sum(axis=1) > np.asarray(totals)):
+        while alloc[i].sum() > totals[i]:
+            over = np.where(alloc[i] > 0, effective[i] - alloc[i], np.inf)
+            alloc[i, np.argmin(over)] -= 1
+    return alloc
+
+
+def ledger_drift(ledger):
+    """Cumulative MP seats per category: owed by share, allocated, drift and outstanding carry."""
+    expected, allocated = ledger.get("expected", {}), ledger.get("allocated", {})
+    carry = {}
+    for rem in ledger.get("carry", {}).values():
+        for cat, r in rem.items():
+            carry[cat] = carry.get(cat, 0.0) + r
+    cats = list(dict.fromkeys(list(expected) + list(allocated) + list(carry)))
+    df = pd.DataFrame({
+        "Category": cats,
+        "Expected": [round(expected.get(c, 0.0), 2) for c in cats],
+        "Allocated": [allocated.get(c, 0) for c in cats],
+        "Carry": [round(carry.get(c, 0.0), 2) for c in cats],
+    })
+    df["Drift"] = (df["Allocated"] - df["Expected"]).round(2)
+    return df
+
+
+def distribute_to_mp(total_seats, config, carry_forward=None):
+    if carry_forward is None:
+        carry_forward = {}
+
+    mp_frac = _pool_fractions(config)
+    cats = list(mp_frac.keys())
+    alloc, effective = _apportion_pools(
+        [total_seats], mp_frac, carry=[[float(carry_forward.get(cat, 0.0)) for cat in cats]]
+    )
+    alloc = dict(zip(cats, alloc[0].tolist()))
+    effective = dict(zip(cats, effective[0].tolist()))
 
     next_carry = {cat: effective[cat] - alloc[cat] for cat in effective.keys()}
     rows = [{"Category": cat, "Seats": int(cnt), "ConvertedFrom": "MP_POOL"} for cat, cnt in alloc.items() if cnt > 0]
@@ -164,203 +216,305 @@ def distribute_to_mp(total_seats, config, carry_forward=None):
 
 
 
-def _allocate_among_colleges(total_seats, college_shares):
+def _college_order(college):
+    """Sort key that, like pandas, puts numeric college codes before text ones."""
+    return (isinstance(college, str), college)
+
+
+def _allocate_among_colleges_matrix(totals, college_shares):
     """
-    Hamilton method allocation among colleges.
+    Hamilton method allocation of several target totals among colleges at once.
+    totals: seat total per target category
     college_shares: dict college -> non-negative number (proportional share)
-    returns dict college -> int seats summing to total_seats
+    returns int matrix targets x colleges (college_shares order), each row summing
+    to its total (0 for totals <= 0). Remainder ties, and the equal split used when
+    no college has a share, go to the lower college code.
     """
-    if total_seats <= 0:
-        return {c: 0 for c in college_shares}
+    colleges = list(college_shares.keys())
+    totals = np.asarray(totals, dtype=np.int64).reshape(-1)
+    alloc = np.zeros((len(totals), len(colleges)), dtype=np.int64)
+    live = totals > 0
+    if not live.any():
+        return alloc
+    tie_order = sorted(range(len(colleges)), key=lambda i: _college_order(colleges[i]))
     total_share = sum(college_shares.values())
     if total_share <= 0:
         # equal split
-        base = total_seats // len(college_shares)
-        alloc = {c: base for c in college_shares}
-        rem = total_seats - base * len(college_shares)
-        cols = sorted(college_shares.keys())
-        for i in range(rem):
-            alloc[cols[i % len(cols)]] += 1
+        rank = np.empty(len(colleges), dtype=np.int64)
+        rank[tie_order] = np.arange(len(colleges))
+        base, rem = np.divmod(totals[live], len(colleges))
+        alloc[live] = base[:, None] + (rank[None, :] < rem[:, None])
         return alloc
 
-    effective = {c: (college_shares[c] / total_share) * total_seats for c in college_shares}
-    floor_alloc = {c: int(math.floor(effective[c])) for c in college_shares}
-    assigned = sum(floor_alloc.values())
-    remaining = total_seats - assigned
-    remainders = sorted([(c, effective[c] - floor_alloc[c]) for c in college_shares], key=lambda x: (-x[1], x[0]))
-    for i in range(remaining):
-        floor_alloc[remainders[i % len(remainders)][0]] += 1
-    return floor_alloc
+    fractions = [college_shares[c] / total_share for c in colleges]
+    alloc[live] = apportion_seats(totals[live], fractions, tie_order=tie_order)[0]
+    return alloc
+
+
+def _allocate_among_colleges(total_seats, college_shares):
+    """
+    Hamilton method allocation among colleges.
+    college_shares: dict college -> non-negative number (proportional share)
+    returns dict college -> int seats summing to total_seats
+    """
+    alloc = _allocate_among_colleges_matrix([total_seats], college_shares)[0]
+    return dict(zip(college_shares.keys(), alloc.tolist()))
 
 
-def convert_seats(df, config, forward_map=None, orig_map=None):
+def _build_pools(df, orig_map):
+    """
+    Group by Stream + CollegeType + Course (all colleges pooled). One pass over the
+    rows, pool by pool, builds each pool's category index: rows as (college,
+    category, seats, original category), row positions per category and seat
+    totals per category. New row keys are recorded in orig_map.
+    """
+    group_keys = ["Stream", "InstType", "Course"]
+    gid = df.groupby(group_keys, sort=False).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    order = np.argsort(gid, kind="stable")
+    order = order[gid[order] >= 0]
+    columns = [df[c].to_numpy(dtype=object)[order] for c in group_keys + ["College", "Category"]]
+    pools = []
+    for g, stream, inst, course, college, cat, seats in zip(
+            gid[order].tolist(), *columns, df["Seats"].to_numpy()[order].tolist()):
+        if g == len(pools):
+            pools.append({"key": (stream, inst, course), "rows": [], "by_cat": {}, "seats": {}})
+        pool = pools[g]
+        key = f"{stream}-{inst}-{course}-{college}-{cat}"
+        if key not in orig_map:
+            orig_map[key] = cat
+        pool["by_cat"].setdefault(cat, []).append(len(pool["rows"]))
+        pool["rows"].append((college, cat, seats, orig_map[key]))
+        pool["seats"][cat] = pool["seats"].get(cat, 0) + seats
+    return pools
+
+
+def _pool_input(df):
     df = df.copy()
     df["Category"] = df["Category"].astype(str).str.strip().str.upper()
     df["Seats"] = pd.to_numeric(df["Seats"], errors="coerce").fillna(0).astype(int)
+    return df
 
-    ladders = {k.strip().upper(): [x.strip().upper() for x in v] for k, v in config.get("ladders", {}).items()}
-    direct_to_mp = [c.strip().upper() for c in config.get("direct_to_mp", [])]
-    direct_to_sm = [c.strip().upper() for c in config.get("direct_to_sm", [])]
-    swap_pairs = [(a.strip().upper(), b.strip().upper()) for a, b in config.get("swap_pairs", [])]
-    no_conversion = [c.strip().upper() for c in config.get("no_conversion", [])]
 
+def convert_seats(df, config, forward_map=None, orig_map=None, ledger=None):
     if forward_map is None:
         forward_map = {}
     if orig_map is None:
         orig_map = {}
+    pools = _build_pools(_pool_input(df), orig_map)
+    return _convert_pools(pools, config, ledger), forward_map, orig_map
 
-    results = []
 
-    # --- Group by Stream + CollegeType + Course (all colleges pooled) ---
-    group_keys = ["Stream", "InstType", "Course"]
-    grouped = df.groupby(group_keys, sort=False)
+def _convert_pools(pools, config, ledger=None):
+    """The pooled conversion of pools built by _build_pools; the pools are not modified."""
+    plan = compile_rules(config)
+    ladders, direct_to_mp, direct_to_sm = plan.ladders, plan.direct_to_mp, plan.direct_to_sm
+    swap_pairs, no_conversion = plan.swap_pairs, plan.no_conversion
+
+    results = []
 
-    for group_vals, group in grouped:
-        stream, inst, course = group_vals
-        seats_by_cat = group.groupby("Category")["Seats"].sum().to_dict()
+    # OE / SD seats leave the pool totals before MP sources are picked; the MP
+    # split of every pool is then apportioned in one batch
+    mp_frac = _pool_fractions(config)
+    mp_cats = list(mp_frac.keys())
+    mp_pools, pool_seats, mp_sources = [], [], []
+    for g, pool in enumerate(pools):
+        seats_by_cat = dict(pool["seats"])
+        for cat in ("OE", "SD"):
+            moved = [pool["rows"][i][2] for i in pool["by_cat"].get(cat, []) if pool["rows"][i][2] > 0]
+            if moved:
+                seats_by_cat[cat] = seats_by_cat.get(cat, 0) - sum(moved)
+        pool_seats.append(seats_by_cat)
+        mp_sources.append([c for c in direct_to_mp if seats_by_cat.get(c, 0) > 0])
+        if mp_sources[g]:
+            mp_pools.append(g)
+    mp_alloc = {}
+    if mp_pools:
+        totals = [sum(pool_seats[g][c] for c in mp_sources[g]) for g in mp_pools]
+        if ledger is None:
+            alloc, _ = _apportion_pools(totals, mp_frac)
+        else:
+            # Remainders from earlier rounds are fed back per Stream/InstType/Course pool
+            keys = [_pool_ledger_key(pools[g]["key"]) for g in mp_pools]
+            share = np.asarray(totals, dtype=float)[:, None] * np.array([mp_frac[c] for c in mp_cats])[None, :]
+            carry = _ledger_carry(ledger, keys, mp_cats)
+            # A category's debt can cancel its share this round but never go below zero seats
+            alloc, effective = _apportion_pools(totals, mp_frac, carry=np.maximum(carry, -share))
+            alloc = _trim_to_totals(alloc, effective, totals)
+            _ledger_update(ledger, keys, mp_cats, alloc, share, carry)
+        mp_alloc = dict(zip(mp_pools, alloc.tolist()))
+
+    for g, pool in enumerate(pools):
+        stream, inst, course = pool["key"]
+        rows, by_cat, seats_by_cat = pool["rows"], pool["by_cat"], pool_seats[g]
+        mp_source_cats = mp_sources[g]
         handled = set()
-        converted_targets = set()
-
-        # Preserve original categories
-        for _, row in group.iterrows():
-            key = f"{stream}-{inst}-{course}-{row['College']}-{row['Category']}"
-            if key not in orig_map:
-                orig_map[key] = row['Category']
-
-        # --- Step 1: OE -> SM per college ---
-        for _, row in group.iterrows():
-            if row["Category"] == "OE" and row["Seats"] > 0:
-                results.append({
-                    "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                    "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-OE", "OE"),
-                    "Category": "SM", "Seats": row['Seats'],
-                    "ConvertedFrom": "OE", "ConversionFlag": "Y", "ConversionReason": "OE_to_SM"
-                })
-                seats_by_cat["OE"] = seats_by_cat.get("OE", 0) - row['Seats']
-                handled.add("OE")
-
-        # --- Step 2: SD -> XS per college ---
-        for _, row in group.iterrows():
-            if row["Category"] == "SD" and row["Seats"] > 0:
-                results.append({
-                    "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                    "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-SD", "SD"),
-                    "Category": "XS", "Seats": row['Seats'],
-                    "ConvertedFrom": "SD", "ConversionFlag": "Y", "ConversionReason": "SD_to_XS"
-                })
-                seats_by_cat["SD"] = seats_by_cat.get("SD", 0) - row['Seats']
-                handled.add("SD")
+
+        def emit(college, orig, cat, seats, conv_from, flag, reason):
+            results.append({
+                "Stream": stream, "InstType": inst, "Course": course, "College": college,
+                "OriginalCategory": orig, "Category": cat, "Seats": seats,
+                "ConvertedFrom": conv_from, "ConversionFlag": flag, "ConversionReason": reason
+            })
+
+        # --- Step 1: OE -> SM per college, Step 2: SD -> XS per college ---
+        for src, dst, reason in (("OE", "SM", "OE_to_SM"), ("SD", "XS", "SD_to_XS")):
+            for i in by_cat.get(src, []):
+                college, _, seats, orig = rows[i]
+                if seats > 0:
+                    emit(college, orig, dst, seats, src, "Y", reason)
+                    handled.add(src)
 
         # --- Step 3: Direct -> MP using pooled Hamilton method ---
-        mp_source_cats = [c for c in direct_to_mp if seats_by_cat.get(c, 0) > 0]
         if mp_source_cats:
-            total_mp = sum(seats_by_cat[c] for c in mp_source_cats)
-            rows, _ = distribute_to_mp(total_mp, config)
-
-            # Build per-college source counts (sum of all mp_source_cats in that college)
-            college_source_counts = {}
-            for college, sub in group.groupby('College'):
-                college_source_counts[college] = int(sub.loc[sub['Category'].isin(mp_source_cats), 'Seats'].sum())
+            source_set = set(mp_source_cats)
+            colleges = pd.unique(pd.Series([r[0] for r in rows], dtype=object).dropna())
+            college_source_counts = {college: 0 for college in sorted(colleges, key=_college_order)}
+            for cat in source_set:
+                for i in by_cat.get(cat, []):
+                    if rows[i][0] in college_source_counts:
+                        college_source_counts[rows[i][0]] += rows[i][2]
 
             total_source_seats = sum(college_source_counts.values())
             if total_source_seats == 0:
-                # nothing to distribute
-                for _, row in group.iterrows():
-                    if row['Category'] in mp_source_cats:
-                        # keep as is (or mark no conversion)
-                        results.append({
-                            "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                            "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-{row['Category']}", row['Category']),
-                            "Category": row['Category'], "Seats": row['Seats'],
-                            "ConvertedFrom": "", "ConversionFlag": "N",
-                            "ConversionReason": "NoMPSourceSeats"
-                        })
-                for c in mp_source_cats:
-                    handled.add(c)
+                # nothing to distribute: keep the source rows as they are
+                for college, cat, seats, orig in rows:
+                    if cat in source_set:
+                        emit(college, orig, cat, seats, "", "N", "NoMPSourceSeats")
             else:
-                # For each target MP category (row in rows), allocate its seats among colleges by Hamilton using college_source_counts
-                for r in rows:
-                    target_cat = r['Category']
-                    target_total = r['Seats']
-                    alloc_by_college = _allocate_among_colleges(target_total, college_source_counts)
-                    for college, allocated in alloc_by_college.items():
-                        if allocated <= 0:
-                            continue
-                        results.append({
-                        "Stream": stream, "InstType": inst, "Course": course, "College": college,
-                        "OriginalCategory": ",".join(sorted(mp_source_cats)),  # show actual categories merged cleanly
-                        "Category": target_cat, "Seats": allocated,
-                        "ConvertedFrom": ",".join(sorted(mp_source_cats)),
-                        "ConversionFlag": "Y", "ConversionReason": "DirectToMP"
-                    })
-
-                for c in mp_source_cats:
-                    handled.add(c)
-
-        # --- Step 4: Direct -> SM ---
-        for _, row in group.iterrows():
-            if row["Category"] in direct_to_sm and row["Category"] not in handled:
-                results.append({
-                    "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                    "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-{row['Category']}", row["Category"]),
-                    "Category": "SM", "Seats": row['Seats'],
-                    "ConvertedFrom": row["Category"], "ConversionFlag": "Y", "ConversionReason": "DirectToSM"
-                })
-                handled.add(row["Category"])
+                # every MP category's seats are split among colleges by their source seats at once
+                merged = ",".join(sorted(mp_source_cats))
+                targets = [(cat, n) for cat, n in zip(mp_cats, mp_alloc[g]) if n > 0]
+                by_college = _allocate_among_colleges_matrix([n for _, n in targets], college_source_counts)
+                for (target_cat, _), alloc in zip(targets, by_college.tolist()):
+                    for college, allocated in zip(college_source_counts.keys(), alloc):
+                        if allocated > 0:
+                            emit(college, merged, target_cat, allocated, merged, "Y", "DirectToMP")
+            handled.update(mp_source_cats)
+
+        # --- Step 4: Direct -> SM (first row of each category) ---
+        firsts = sorted(by_cat[c][0] for c in set(direct_to_sm) if c in by_cat and c not in handled)
+        for i in firsts:
+            college, cat, seats, orig = rows[i]
+            emit(college, orig, "SM", seats, cat, "Y", "DirectToSM")
+            handled.add(cat)
 
         # --- Step 5: Ladder conversions ---
-        for _, row in group.iterrows():
-            cat = row["Category"]
-            if cat in handled:
-                continue
-            seats = row["Seats"]
-            if seats <= 0:
+        for college, cat, seats, orig in rows:
+            if cat in handled or seats <= 0:
                 continue
             if cat in ladders:
                 chosen = ladders[cat][0]  # take first available ladder target
-                results.append({
-                    "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                    "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-{cat}", cat),
-                    "Category": chosen, "Seats": seats,
-                    "ConvertedFrom": cat, "ConversionFlag":"Y", "ConversionReason": f"{cat}_to_{chosen}"
-                })
-                converted_targets.add(chosen)
+                emit(college, orig, chosen, seats, cat, "Y", f"{cat}_to_{chosen}")
             else:
-                results.append({
-                    "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                    "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-{cat}", cat),
-                    "Category": cat, "Seats": seats,
-                    "ConvertedFrom": "", "ConversionFlag":"N",
-                    "ConversionReason":"NoRule_keep" if cat not in no_conversion else "NoConversion"
-                })
+                emit(college, orig, cat, seats, "", "N",
+                     "NoRule_keep" if cat not in no_conversion else "NoConversion")
 
         # --- Step 6: Swap pairs ---
         for a, b in swap_pairs:
-            a_seats = seats_by_cat.get(a, 0)
-            b_seats = seats_by_cat.get(b, 0)
-            if a_seats > 0 and b_seats > 0:
-                for _, row in group.iterrows():
-                    if row["Category"] == a:
-                        results.append({
-                            "Stream": stream, "InstType": inst, "Course": course, "College": row["College"],
-                            "OriginalCategory": orig_map.get(f"{stream}-{inst}-{course}-{row['College']}-{a}", a),
-                            "Category": b, "Seats": row['Seats'],
-                            "ConvertedFrom": a, "ConversionFlag": "Y", "ConversionReason": f"{a}_to_{b}"
-                        })
+            if seats_by_cat.get(a, 0) > 0 and seats_by_cat.get(b, 0) > 0:
+                for i in by_cat.get(a, []):
+                    college, _, seats, orig = rows[i]
+                    emit(college, orig, b, seats, a, "Y", f"{a}_to_{b}")
                 handled.add(a)
 
     out_df = pd.DataFrame(results)
     columns_order = ["Stream","InstType","Course","College","OriginalCategory","Category","Seats","ConvertedFrom","ConversionFlag","ConversionReason"]
-    out_df = out_df[[c for c in columns_order if c in out_df.columns]]
-    return out_df, forward_map, orig_map
+    return out_df[[c for c in columns_order if c in out_df.columns]]
+
+
+def scenario_totals(df, scenarios, ledger=None):
+    """
+    {name: category totals} of the pooled engine for each {name: config}. The pools
+    are built once; each scenario starts from its own copy of the MP ledger.
+    """
+    pools = _build_pools(_pool_input(df), {})
+    totals = {}
+    for name, config in scenarios.items():
+        out = _convert_pools(pools, config, copy.deepcopy(ledger) if ledger is not None else None)
+        totals[name] = out.groupby("Category")["Seats"].sum() if len(out) else pd.Series(dtype=np.int64)
+    return totals
 
 
 # ---------------------------
 # Process Excel
 # ---------------------------
-def process_excel(input_file, output_file, config, round_num, forward_map=None, orig_map=None):
-    df = pd.read_excel(input_file, engine="openpyxl")
+def sidecar_path(output_file):
+    """Parquet copy of a round's converted data, next to its workbook."""
+    return Path(output_file).with_suffix(".parquet")
+
+
+def _read_file(path):
+    """Deferred download data: the file is read only when the button is clicked."""
+    return lambda: Path(path).read_bytes()
+
+
+def manifest_path(output_file):
+    """Round manifest (sheets, row counts, checksums, preview), next to its workbook."""
+    return Path(output_file).with_suffix(".manifest.json")
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_manifest(output_file, round_num, config, sheets, preview_sheet):
+    """Describe a written round so the previous-rounds browser needs no workbook read."""
+    output_file, sidecar = Path(output_file), sidecar_path(output_file)
+    preview = json.loads(sheets[preview_sheet].head(MANIFEST_PREVIEW_ROWS).to_json(orient="split", index=False))
+    manifest = {
+        "round": round_num,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config_hash": config_hash(config),
+        "workbook": {"file": output_file.name, "bytes": output_file.stat().st_size,
+                     "sha256": _file_sha256(output_file)},
+        "sidecar": {"file": sidecar.name, "bytes": sidecar.stat().st_size,
+                    "sha256": _file_sha256(sidecar)} if sidecar.exists() else None,
+        "sheets": [{"name": name, "rows": len(df), "columns": [str(c) for c in df.columns]}
+                   for name, df in sheets.items()],
+        "preview": {"sheet": preview_sheet, "columns": preview["columns"], "data": preview["data"]},
+    }
+    target = manifest_path(output_file)
+    with open(str(target) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(str(target) + ".tmp", target)
+    return manifest
+
+
+def read_manifest(output_file):
+    """The round's manifest, or None when missing, unreadable or older than the workbook."""
+    target = manifest_path(output_file)
+    try:
+        with open(target, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("workbook", {}).get("bytes") != Path(output_file).stat().st_size:
+        return None
+    return manifest
+
+
+def summary_frame(converted):
+    """SummaryRound sheet: converted rows in the input's column names."""
+    converted_summary = converted.rename(columns={
+        "Stream": "C",
+        "InstType": "CollegeType",
+        "College": "CollegeCode",
+        "Course": "CourseCode",
+        "Seats": "Seat"
+    })
+    summary_cols = ["C","CollegeType","CourseCode","CollegeCode","OriginalCategory","Category","Seat"]
+    for col in summary_cols:
+        if col not in converted_summary.columns:
+            converted_summary[col] = ""
+    return converted_summary[summary_cols]
 
+
+def work_frame(df):
+    """Input sheet columns (C, CollegeType, CourseCode, ...) renamed to the engine's."""
     work_df = df.rename(columns={
         "C": "Stream",
         "CollegeType": "InstType",
@@ -369,44 +523,51 @@ def process_excel(input_file, output_file, config, round_num, forward_map=None,
         "Category": "Category",
         "Seat": "Seats"
     })
+    return work_df[["Stream", "InstType", "Course", "College", "Category", "Seats"]]
+
+
+def process_excel(input_file, output_file, config, round_num, forward_map=None, orig_map=None, ledger=None):
+    df = pd.read_excel(input_file, engine="openpyxl")
 
     converted, forward_map, orig_map = convert_seats(
-        work_df[["Stream", "InstType", "Course", "College", "Category", "Seats"]],
+        work_frame(df),
         config,
         forward_map=forward_map,
-        orig_map=orig_map
+        orig_map=orig_map,
+        ledger=ledger
     )
     converted["Round"] = round_num
 
-    # Summary
-    converted_summary = converted.rename(columns={
-        "Stream": "C",
-        "InstType": "CollegeType",
-        "College": "CollegeCode",
-        "Course": "CourseCode",
-        "Seats": "Seat"
-    })
-    summary_cols = ["C","CollegeType","CourseCode","CollegeCode","OriginalCategory","Category","Seat"]
-    for col in summary_cols:
-        if col not in converted_summary.columns:
-            converted_summary[col] = ""
-    converted_summary = converted_summary[summary_cols]
+    converted_summary = summary_frame(converted)
 
-    # Save Excel
+    # Save Excel: all sheets streamed in one pass, swapped in once complete
     output_file = Path(output_file)
-    mode = 'a' if output_file.exists() else 'w'
-
-    if mode == 'a':
-        with pd.ExcelWriter(output_file, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
-            df.to_excel(writer, sheet_name="InputData", index=False)
-            converted.to_excel(writer, sheet_name=f"ConvertedRound{round_num}", index=False)
-            converted_summary.to_excel(writer, sheet_name=f"SummaryRound{round_num}", index=False)
-    else:
-        with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="InputData", index=False)
-            converted.to_excel(writer, sheet_name=f"ConvertedRound{round_num}", index=False)
-            converted_summary.to_excel(writer, sheet_name=f"SummaryRound{round_num}", index=False)
-
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    sheets = {
+        "InputData": df,
+        f"ConvertedRound{round_num}": converted,
+        f"SummaryRound{round_num}": converted_summary,
+    }
+    write_xlsx_streaming(str(tmp_file), sheets)
+    os.replace(tmp_file, output_file)
+
+    # Columnar sidecar of the detailed output for programmatic reuse; the round
+    # does not depend on it, so a failed write only drops the sidecar
+    sidecar = sidecar_path(output_file)
+    try:
+        sidecar_df = converted.copy(deep=False)
+        for col in ["Stream", "InstType", "Course", "College", "OriginalCategory", "Category"]:
+            if col in sidecar_df.columns and sidecar_df[col].dtype == object:
+                sidecar_df[col] = sidecar_df[col].astype(str)
+        sidecar_df.to_parquet(str(sidecar) + ".tmp", index=False, compression="zstd")
+        os.replace(str(sidecar) + ".tmp", sidecar)
+    except Exception as e:
+        for stale in (sidecar, Path(str(sidecar) + ".tmp")):
+            if stale.exists():
+                stale.unlink()
+        st.warning(f"⚠️ Parquet sidecar not written: {e}")
+
+    write_manifest(output_file, round_num, config, sheets, f"SummaryRound{round_num}")
     return converted_summary, converted, forward_map, orig_map
 # ---------------------------
 # Streamlit UI
@@ -474,11 +635,12 @@ def seat_conversion_ui():
             out_file = f"converted_round{current_round}.xlsx"
             forward_map = session.get("forward_map", {})
             orig_map = session.get("orig_map", {})
+            ledger = copy.deepcopy(session.get("mp_ledger", {}))
 
             try:
                 converted_summary, converted_detailed, new_forward_map, new_orig_map = process_excel(
                     excel_buffer, out_file, config, current_round,
-                    forward_map=forward_map, orig_map=orig_map
+                    forward_map=forward_map, orig_map=orig_map, ledger=ledger
                 )
 
                 # Ensure all strings are upper case
@@ -489,6 +651,7 @@ def seat_conversion_ui():
                 # Update session
                 session["forward_map"] = new_forward_map
                 session["orig_map"] = new_orig_map
+                session["mp_ledger"] = ledger
                 session["last_round"] = current_round
                 session["last_input_file"] = uploaded_file.name
                 session["last_output_file"] = out_file
@@ -497,15 +660,35 @@ def seat_conversion_ui():
                 st.success(f"✅ Round {current_round} conversion complete")
                 st.download_button(
                     "⬇️ Download Converted Excel",
-                    data=open(out_file, "rb").read(),
+                    data=_read_file(out_file),
                     file_name=os.path.basename(out_file),
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
                 st.dataframe(converted_summary.head())
+                with st.expander("⚖️ MP Fairness Drift (cumulative)"):
+                    st.dataframe(ledger_drift(ledger), use_container_width=True)
 
             except Exception as e:
                 st.error(f"❌ Error: {e}")
 
+    # What-if: the uploaded matrix under several rule variants, category totals side by side
+    with st.expander("🧪 What-if Scenarios"):
+        st.caption('JSON object of scenario name → rule overrides, e.g. '
+                   '{"MP 60% SM": {"mp_distribution": {...}}, "SC ladder": {"ladders": {...}}}. '
+                   'Each scenario starts from the current MP ledger; the session is not changed.')
+        scenarios_text = st.text_area("Scenarios", value="{}", height=160, key="whatif_scenarios")
+        if uploaded_file and st.button("🧪 Compare Scenarios"):
+            try:
+                overrides = json.loads(scenarios_text)
+                scenarios = {"Current": config}
+                scenarios.update((name, scenario_config(config, **o)) for name, o in overrides.items())
+                uploaded_file.seek(0)
+                comparison = simulate_scenarios(work_frame(pd.read_excel(uploaded_file, engine="openpyxl")),
+                                                scenarios, engine="pooled", ledger=session.get("mp_ledger", {}))
+                st.dataframe(comparison, use_container_width=True)
+            except Exception as e:
+                st.error(f"❌ Error: {e}")
+
     # ---------------------------
     # Previous Rounds Selector with Download
     # ---------------------------
@@ -516,19 +699,32 @@ def seat_conversion_ui():
         selected_file = st.selectbox("Select a round to preview/download", [""] + converted_files)
         if selected_file:
             try:
-                xls = pd.ExcelFile(selected_file, engine="openpyxl")
-                summary_sheets = [s for s in xls.sheet_names if "Summary" in s or "ConvertedRound" in s]
-                sheet_to_load = summary_sheets[-1] if summary_sheets else xls.sheet_names[0]
-                df_prev = pd.read_excel(xls, sheet_name=sheet_to_load)
-                
-                st.markdown(f"**Preview of {selected_file} ({sheet_to_load})**")
-                st.dataframe(df_prev.head())
-    
-                with open(selected_file, "rb") as f:
-                    excel_bytes = f.read()
+                manifest = read_manifest(selected_file)
+                if manifest:
+                    preview = manifest["preview"]
+                    st.markdown(f"**Preview of {selected_file} ({preview['sheet']})**")
+                    st.dataframe(pd.DataFrame(preview["data"], columns=preview["columns"]))
+                    st.caption(
+                        " · ".join(f"{s['name']}: {s['rows']} rows" for s in manifest["sheets"])
+                        + f" · rules {manifest['config_hash'][:8]} · sha256 {manifest['workbook']['sha256'][:12]}"
+                        + f" · {manifest['created']}"
+                    )
+
+                if manifest is None or st.checkbox("📖 Open full workbook", key=f"open_{selected_file}"):
+                    xls = pd.ExcelFile(selected_file, engine="openpyxl")
+                    sheet_names = xls.sheet_names
+                    summary_sheets = [s for s in sheet_names if "Summary" in s or "ConvertedRound" in s]
+                    default_sheet = summary_sheets[-1] if summary_sheets else sheet_names[0]
+                    sheet_to_load = default_sheet if manifest is None else st.selectbox(
+                        "Sheet", sheet_names, index=sheet_names.index(default_sheet))
+                    df_prev = pd.read_excel(xls, sheet_name=sheet_to_load)
+
+                    st.markdown(f"**{selected_file} ({sheet_to_load})**")
+                    st.dataframe(df_prev if manifest else df_prev.head())
+
                 st.download_button(
                     label=f"⬇️ Download {selected_file}",
-                    data=excel_bytes,
+                    data=_read_file(selected_file),
                     file_name=os.path.basename(selected_file),
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
@@ -0,0 +1,133 @@
+# seat_history.py
+import os
+import re
+import json
+import time
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+HISTORY_DIR = "round_history"
+
+# Session directories under HISTORY_DIR untouched this long are removed by prune_history
+HISTORY_MAX_AGE_DAYS = 7
+
+# Session-level state (forward_map, last round) kept next to the rounds
+STATE_FILE = "session.json"
+
+_ROUND_RE = re.compile(r"^round_(\d{4})\.parquet$")
+
+
+class RoundHistory:
+    """
+    Converted rounds kept on disk as zstd-compressed parquet files, one per round.
+
+    Only per-round metadata (rows, columns, size, save time) stays in memory;
+    load() reads a round when it is asked for and keeps just the last one read.
+    Each conversion session gets its own directory (see session_history), so
+    rounds of different sessions never mix; rounds already in the directory are
+    picked up on construction, and save_state/load_state keep the session's own
+    state with them so a reopened directory resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._meta = {}
+        self._loaded = (None, None)
+        if os.path.isdir(path):
+            import pyarrow.parquet as pq
+            for name in os.listdir(path):
+                match = _ROUND_RE.match(name)
+                if not match:
+                    continue
+                file = os.path.join(path, name)
+                info = pq.read_metadata(file)
+                self._meta[int(match.group(1))] = {
+                    "rows": info.num_rows,
+                    "columns": [c for c in info.schema.names if not c.startswith("__")],
+                    "bytes": os.path.getsize(file),
+                    "saved": datetime.fromtimestamp(os.path.getmtime(file)).isoformat(timespec="seconds"),
+                }
+
+    def _file(self, round_num):
+        return os.path.join(self.path, f"round_{int(round_num):04d}.parquet")
+
+    def __contains__(self, round_num):
+        return round_num in self._meta
+
+    def __len__(self):
+        return len(self._meta)
+
+    def __bool__(self):
+        return bool(self._meta)
+
+    def rounds(self, reverse=False):
+        return sorted(self._meta, reverse=reverse)
+
+    def info(self, round_num):
+        """Metadata of one round: rows, columns, bytes on disk, save time."""
+        return dict(self._meta[round_num])
+
+    def save(self, round_num, df):
+        """Write (or replace) the round's output; the frame is not kept in memory."""
+        os.makedirs(self.path, exist_ok=True)
+        target = self._file(round_num)
+        tmp = target + ".tmp"
+        df.to_parquet(tmp, index=False, compression="zstd")
+        os.replace(tmp, target)
+        self._meta[round_num] = {
+            "rows": len(df),
+            "columns": [str(c) for c in df.columns],
+            "bytes": os.path.getsize(target),
+            "saved": datetime.now().isoformat(timespec="seconds"),
+        }
+        if self._loaded[0] == round_num:
+            self._loaded = (None, None)
+        return target
+
+    def load(self, round_num):
+        """The round's output as a DataFrame, read from disk unless it was the last one loaded."""
+        if round_num not in self._meta:
+            raise KeyError(round_num)
+        if self._loaded[0] != round_num:
+            self._loaded = (round_num, pd.read_parquet(self._file(round_num)))
+        return self._loaded[1]
+
+    def save_state(self, **state):
+        """Write the session state (JSON-serializable values) next to the rounds."""
+        os.makedirs(self.path, exist_ok=True)
+        target = os.path.join(self.path, STATE_FILE)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(target + ".tmp", target)
+
+    def load_state(self):
+        """The state last written by save_state, or {}."""
+        target = os.path.join(self.path, STATE_FILE)
+        if not os.path.exists(target):
+            return {}
+        with open(target, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def clear(self):
+        """Delete every stored round, the session state and the directory itself."""
+        self._meta = {}
+        self._loaded = (None, None)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def session_history(session_id, root=HISTORY_DIR):
+    """History of one conversion session, in root/<session_id>/."""
+    return RoundHistory(os.path.join(root, session_id))
+
+
+def prune_history(root=HISTORY_DIR, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """Remove session directories whose last write is older than max_age_days."""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
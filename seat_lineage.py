@@ -0,0 +1,207 @@
+# seat_lineage.py
+import os
+import re
+from collections.abc import MutableMapping
+
+import numpy as np
+
+LINEAGE_DIR = "lineage"
+
+# key = group id << CAT_BITS | category id
+CAT_BITS = 20
+_SEGMENT_RE = re.compile(r"^seg_(\d{6})\.npz$")
+
+
+class LineageStore(MutableMapping):
+    """
+    Integer-keyed replacement for the orig_map dict.
+
+    Keys stay the engines' "{stream}-{inst}-{course}-{college}-{cat}" strings, but
+    the group prefix and the categories are interned once, so each entry is an
+    (int key -> int origin) pair. With a directory, save() appends only the entries
+    changed since the last save as one segment file, and the segments are read on
+    first access.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._groups, self._group_id = [], {}
+        self._cats, self._cat_id = [], {}
+        self._origin = {}
+        self._pending = {}
+        self._saved_groups = self._saved_cats = 0
+        self._segments = 0
+        self._loaded = path is None
+        self._sorted = None
+
+    # ---------------------------
+    # Interning
+    # ---------------------------
+    def _intern_group(self, prefix):
+        gid = self._group_id.get(prefix)
+        if gid is None:
+            gid = self._group_id[prefix] = len(self._groups)
+            self._groups.append(prefix)
+        return gid
+
+    def _intern_cat(self, cat):
+        cid = self._cat_id.get(cat)
+        if cid is None:
+            cid = self._cat_id[cat] = len(self._cats)
+            if cid >= 1 << CAT_BITS:
+                raise ValueError("Too many distinct categories for the lineage store")
+            self._cats.append(cat)
+        return cid
+
+    def _key(self, key, create=False):
+        if not isinstance(key, str) or "-" not in key:
+            raise KeyError(key)
+        prefix, cat = key.rsplit("-", 1)
+        if create:
+            return self._intern_group(prefix) << CAT_BITS | self._intern_cat(cat)
+        gid, cid = self._group_id.get(prefix), self._cat_id.get(cat)
+        if gid is None or cid is None:
+            return None
+        return gid << CAT_BITS | cid
+
+    # ---------------------------
+    # Mapping interface
+    # ---------------------------
+    def __getitem__(self, key):
+        self._load()
+        k = self._key(key)
+        if k is None or k not in self._origin:
+            raise KeyError(key)
+        return self._cats[self._origin[k]]
+
+    def __contains__(self, key):
+        self._load()
+        k = self._key(key) if isinstance(key, str) and "-" in key else None
+        return k is not None and k in self._origin
+
+    def __setitem__(self, key, value):
+        self._load()
+        k = self._key(key, create=True)
+        origin = self._intern_cat(value)
+        if self._origin.get(k) != origin:
+            self._origin[k] = origin
+            self._pending[k] = origin
+            self._sorted = None
+
+    def __delitem__(self, key):
+        self._load()
+        k = self._key(key)
+        if k is None or k not in self._origin:
+            raise KeyError(key)
+        del self._origin[k]
+        self._pending[k] = -1
+        self._sorted = None
+
+    def __iter__(self):
+        self._load()
+        mask = (1 << CAT_BITS) - 1
+        for k in list(self._origin):
+            yield f"{self._groups[k >> CAT_BITS]}-{self._cats[k & mask]}"
+
+    def __len__(self):
+        self._load()
+        return len(self._origin)
+
+    def __repr__(self):
+        return f"LineageStore(path={self.path!r}, entries={len(self)})"
+
+    # ---------------------------
+    # Bulk lookups
+    # ---------------------------
+    def _columns(self):
+        """(keys, origins) sorted by key, rebuilt after changes."""
+        if self._sorted is None:
+            keys = np.fromiter(self._origin.keys(), dtype=np.int64, count=len(self._origin))
+            origins = np.fromiter(self._origin.values(), dtype=np.int64, count=len(self._origin))
+            order = np.argsort(keys, kind="stable")
+            self._sorted = (keys[order], origins[order])
+        return self._sorted
+
+    def lookup(self, prefixes, cats, default=None):
+        """Origins for every prefix x category pair as an object array, default where unknown."""
+        self._load()
+        out = np.full((len(prefixes), len(cats)), default, dtype=object)
+        gids = np.array([self._group_id.get(p, -1) for p in prefixes], dtype=np.int64)
+        cids = np.array([self._cat_id.get(c, -1) for c in cats], dtype=np.int64)
+        rows, cols = np.flatnonzero(gids >= 0), np.flatnonzero(cids >= 0)
+        keys, origins = self._columns()
+        if not len(rows) or not len(cols) or not len(keys):
+            return out
+        query = (gids[rows][:, None] << CAT_BITS) | cids[cols][None, :]
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        hit = keys[pos] == query
+        names = np.array(self._cats, dtype=object)
+        sub = out[np.ix_(rows, cols)]
+        sub[hit] = names[origins[pos[hit]]]
+        out[np.ix_(rows, cols)] = sub
+        return out
+
+    def descendants(self, origin):
+        """Current (prefix, category) entries whose lineage starts at the origin category."""
+        self._load()
+        oid = self._cat_id.get(origin)
+        if oid is None:
+            return []
+        keys, origins = self._columns()
+        mask = (1 << CAT_BITS) - 1
+        return [(self._groups[k >> CAT_BITS], self._cats[k & mask]) for k in keys[origins == oid].tolist()]
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _segment_files(self):
+        if not self.path or not os.path.isdir(self.path):
+            return []
+        return sorted(f for f in os.listdir(self.path) if _SEGMENT_RE.match(f))
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for name in self._segment_files():
+            with np.load(os.path.join(self.path, name), allow_pickle=False) as seg:
+                for prefix in seg["groups"].tolist():
+                    self._intern_group(prefix)
+                for cat in seg["cats"].tolist():
+                    self._intern_cat(cat)
+                for k, origin in zip(seg["keys"].tolist(), seg["origins"].tolist()):
+                    if origin < 0:
+                        self._origin.pop(k, None)
+                    else:
+                        self._origin[k] = origin
+            self._segments = int(_SEGMENT_RE.match(name).group(1))
+        self._saved_groups, self._saved_cats = len(self._groups), len(self._cats)
+
+    def save(self):
+        """Append the entries changed since the last save as a new segment; returns its path."""
+        self._load()
+        if not self.path or not self._pending:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        self._segments += 1
+        target = os.path.join(self.path, f"seg_{self._segments:06d}.npz")
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(
+                f,
+                groups=np.array(self._groups[self._saved_groups:], dtype=str),
+                cats=np.array(self._cats[self._saved_cats:], dtype=str),
+                keys=np.fromiter(self._pending.keys(), dtype=np.int64, count=len(self._pending)),
+                origins=np.fromiter(self._pending.values(), dtype=np.int32, count=len(self._pending)),
+            )
+        os.replace(tmp, target)
+        self._saved_groups, self._saved_cats = len(self._groups), len(self._cats)
+        self._pending = {}
+        return target
+
+    def clear(self):
+        """Drop every entry, in memory and on disk."""
+        for name in self._segment_files():
+            os.remove(os.path.join(self.path, name))
+        self.__init__(self.path)
+        self._loaded = True
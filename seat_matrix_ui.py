@@ -1,7 +1,7 @@
 # seat_matrix_ui.py
 import pandas as pd
 import streamlit as st
-from common_functions import load_table, save_table, clean_columns, download_button_for_df, filter_and_sort_dataframe
+from common_functions import load_table, save_table, save_table_changes, clean_columns, download_button_for_df, filter_and_sort_dataframe
 
 
 def seat_matrix_ui(year, program):
@@ -15,9 +15,7 @@ def seat_matrix_ui(year, program):
             st.subheader(f"{seat_type} Seat Matrix")
 
             # Load only selected seat type
-            df_seat = load_table("Seat Matrix", year, program)
-            if "SeatType" in df_seat.columns:
-                df_seat = df_seat[df_seat["SeatType"] == seat_type]
+            df_seat = load_table("Seat Matrix", year, program, filters={"SeatType": seat_type})
 
             # Upload
             uploaded = st.file_uploader(
@@ -33,8 +31,7 @@ def seat_matrix_ui(year, program):
                     df_new["Program"] = program
                     df_new["SeatType"] = seat_type
                     save_table("Seat Matrix", df_new, replace_where={"AdmissionYear": year, "Program": program, "SeatType": seat_type})
-                    df_seat = load_table("Seat Matrix", year, program)
-                    df_seat = df_seat[df_seat["SeatType"] == seat_type]
+                    df_seat = load_table("Seat Matrix", year, program, filters={"SeatType": seat_type})
                     st.success(f"✅ {seat_type} Seat Matrix uploaded successfully!")
                 except Exception as e:
                     st.error(f"Error reading file: {e}")
@@ -57,7 +54,8 @@ def seat_matrix_ui(year, program):
                     edited_seat["Program"] = program
                 if "SeatType" not in edited_seat.columns:
                     edited_seat["SeatType"] = seat_type
-                save_table("Seat Matrix", edited_seat, replace_where={"AdmissionYear": year, "Program": program, "SeatType": seat_type})
+                save_table_changes("Seat Matrix", df_seat_filtered, edited_seat,
+                                   replace_where={"AdmissionYear": year, "Program": program, "SeatType": seat_type})
                 st.success(f"✅ {seat_type} Seat Matrix saved!")
                 st.rerun()
 
@@ -104,7 +102,8 @@ def seat_matrix_ui(year, program):
             if "SeatType" not in edited_all.columns:
                 st.warning("⚠️ 'SeatType' column missing! Please add it manually before saving.")
             else:
-                save_table("Seat Matrix", edited_all, replace_where={"AdmissionYear": year, "Program": program})
+                save_table_changes("Seat Matrix", df_all_filtered, edited_all,
+                                   replace_where={"AdmissionYear": year, "Program": program})
                 st.success("✅ All Seat Types saved successfully!")
                 st.rerun()
 
@@ -117,9 +117,11 @@ def student_option_ui(year: str, program: str, student_id: str = None):
                 """, unsafe_allow_html=True)
 
     # --- Right Panel: Preferences ---
-    df_saved = load_table("Student Options", year, program)
-    if student_id and "StudentID" in df_saved.columns:
-        df_saved = df_saved[df_saved["StudentID"] == student_id]
+    df_saved = load_table(
+        "Student Options", year, program,
+        columns=["StudentID", "College", "Course", "Preference"],
+        filters={"StudentID": student_id} if student_id else None
+    )
 
     with col_right:
         st.markdown("### ✅ Your Preferences")
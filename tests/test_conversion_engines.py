@@ -0,0 +1,85 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from seat_conversion_logic import convert_seats, parse_codes, scenario_config, simulate_scenarios
+from seat_lineage import LineageStore
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "conversion")
+ROUNDS = (1, 2)
+
+
+def _fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+def _round_input(round_num):
+    df = pd.read_csv(_fixture(f"round{round_num}.csv"), dtype={"Code": str})
+    parsed = parse_codes(df["Code"])
+    return pd.concat([parsed, df["Seats"]], axis=1)[["Stream", "InstType", "Course", "College", "Category", "Seats"]]
+
+
+def _golden(round_num):
+    expected = pd.read_csv(_fixture(f"round{round_num}_expected.csv"), dtype=str, keep_default_na=False)
+    expected["Seats"] = expected["Seats"].astype(int)
+    with open(_fixture(f"round{round_num}_maps.json"), encoding="utf-8") as f:
+        maps = json.load(f)
+    return expected, maps["forward_map"], maps["orig_map"]
+
+
+def _as_golden(df):
+    df = df.reset_index(drop=True).copy()
+    for col in df.columns:
+        df[col] = df[col].astype(int) if col == "Seats" else df[col].astype(str)
+    return df
+
+
+@pytest.fixture(scope="module")
+def config():
+    with open(_fixture("config.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("engine,lineage", [("loop", dict), ("matrix", dict), ("matrix", LineageStore)])
+def test_engine_matches_golden_across_rounds(config, engine, lineage):
+    forward_map, orig_map = {}, lineage()
+    for round_num in ROUNDS:
+        converted, forward_map, orig_map = convert_seats(
+            _round_input(round_num), config, forward_map, orig_map, engine=engine)
+        expected, expected_forward, expected_orig = _golden(round_num)
+
+        pd.testing.assert_frame_equal(_as_golden(converted), expected)
+        assert forward_map == expected_forward
+        assert dict(orig_map) == expected_orig
+
+
+def test_loop_and_matrix_engines_agree(config):
+    state = {engine: ({}, {}) for engine in ("loop", "matrix")}
+    for round_num in ROUNDS:
+        outputs = {}
+        for engine, (forward_map, orig_map) in state.items():
+            outputs[engine], forward_map, orig_map = convert_seats(
+                _round_input(round_num), config, forward_map, orig_map, engine=engine)
+            state[engine] = (forward_map, orig_map)
+
+        pd.testing.assert_frame_equal(outputs["loop"], outputs["matrix"])
+        assert state["loop"] == state["matrix"]
+
+
+def test_simulated_scenarios_match_engine_totals(config):
+    _, forward_map, _ = _golden(1)
+    scenarios = {
+        "Current": config,
+        "All MP to SM": scenario_config(config, mp_distribution={"SM": 1.0}),
+        "No ladders": scenario_config(config, ladders={}),
+    }
+    df = _round_input(2)
+    result = simulate_scenarios(df, scenarios, forward_map=forward_map)
+
+    for name, scenario in scenarios.items():
+        converted, _, _ = convert_seats(df, scenario, dict(forward_map), {}, engine="matrix")
+        expected = converted.groupby("Category")["Seats"].sum()
+        assert result[name].reindex(expected.index).tolist() == expected.tolist()
+        assert result[name].drop(expected.index).eq(0).all()
@@ -0,0 +1,44 @@
+import random
+
+import pandas as pd
+import pytest
+
+from seat_conversion_logic import parse_code, parse_codes
+
+ALPHABET = "ABCDEGMPSXZ0123456789 abcdegmpsxz"
+CATEGORIES = ["SM", "SC", "ST", "EW", "XS", "PD", "sc", "sm", "Ez"]
+
+
+def _random_code(rng):
+    kind = rng.random()
+    if kind < 0.2:
+        # short codes, down to empty
+        return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 10)))
+    head = "".join(rng.choice(ALPHABET) for _ in range(7))
+    cat = rng.choice(CATEGORIES)
+    if kind < 0.5:
+        # 2-character category prefix, e.g. "NRSC"
+        field = rng.choice(["NR", "nr", "OE", "X "]) + cat
+    elif kind < 0.6:
+        field = cat.lower()
+    else:
+        field = cat.rjust(4)
+    code = head + field
+    if rng.random() < 0.1:
+        code += rng.choice(["\n", "\r\n", " ", "EXTRA"])
+    return code.lower() if rng.random() < 0.1 else code
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parse_codes_matches_parse_code(seed):
+    rng = random.Random(seed)
+    codes = pd.Series([_random_code(rng) for _ in range(500)] + [None, float("nan"), 12345678901, "EG019"],
+                      index=range(1000, 1504))
+
+    expected = codes.apply(parse_code).apply(pd.Series)
+    actual = parse_codes(codes)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert actual.index.equals(expected.index)
+    for col in expected.columns:
+        assert actual[col].tolist() == expected[col].tolist(), col